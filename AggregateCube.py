@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we will materialise an aggregate cube of the air quality readings of Delhi, having one
+    cell per (year, month, station, pollutant).
+    Every cell keeps the number of raw rows, count/sum/min/max of the readings and a histogram sketch of
+    the readings (counts over the fixed bins SKETCH_EDGES), from which approximate quantiles are computed.
+    As all the measures can be added up, coarser views (per year, per station, ...) are rolled up from the
+    cube without going back to the raw rows. Cells of a year are rebuilt only when its csv file (or the
+    SCHEMA_VERSION of AirQualityData.py) changes.
+'''
+
+
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from AirQualityData import (DATA_DIR, CACHE_DIR, COLUMNAR_SUFFIX, POLLUTANT_COLUMNS, STATION_COLUMN, UNKNOWN_STATION, list_year_files,
+                            load_years, read_year_csv, read_columnar, write_columnar, file_hash, reading_values)
+
+
+
+CUBE_PATH = Path(CACHE_DIR) / ('aggregate_cube'+COLUMNAR_SUFFIX)
+
+CUBE_KEYS = ['year', 'month', 'station', 'pollutant']
+CUBE_MEASURES = ['rows', 'count', 'sum', 'min', 'max', 'sketch']
+
+# Geometric bins from 0.5 to 5000 microgm/m3 (about 7.5% wide each), readings outside fall in the end bins
+SKETCH_EDGES = np.concatenate([[0.0], np.geomspace(0.5, 5000.0, 128)])
+N_SKETCH_BINS = len(SKETCH_EDGES) - 1
+
+
+
+'''
+    This function will build the cube cells of the given rows.
+    data : DataFrame having the unified schema (see AirQualityData.py)
+    source_hash : Hash of the file the rows come from, used by refresh_cube to detect changes (None by default)
+    Returns DataFrame having columns CUBE_KEYS + CUBE_MEASURES + ['source_hash'], one row per cell.
+    Month is 0 for annual aggregates and for rows whose date could not be parsed.
+'''
+def build_cube(data, source_hash=None):
+
+    is_annual = data['granularity'].eq('annual').fillna(False).astype(bool)
+    month = data['date'].dt.month.where(~is_annual).fillna(0).astype('int64')
+    station = data[STATION_COLUMN].astype(object).fillna(UNKNOWN_STATION)
+
+    keys = pd.DataFrame({'year': data['year'].to_numpy(dtype='int64'), 'month': month.to_numpy(), 'station': station.to_numpy()})
+
+    # One long frame having a row per (raw row, pollutant), so all pollutants are aggregated together
+    long_data = pd.concat([keys.assign(pollutant=pollutant, value=reading_values(data[pollutant]))
+                           for pollutant in POLLUTANT_COLUMNS], ignore_index=True)
+
+    grouped = long_data.groupby(CUBE_KEYS, sort=True)
+    cube = grouped['value'].agg(rows='size', count='count', sum='sum', min='min', max='max').reset_index()
+
+    # Histogram of every cell in one bincount, cell numbers follow the (sorted) order of the cube rows
+    cell = grouped.ngroup().to_numpy()
+    values = long_data['value'].to_numpy()
+    is_valid = ~np.isnan(values)
+    bins = np.clip(np.searchsorted(SKETCH_EDGES, values[is_valid], side='right') - 1, 0, N_SKETCH_BINS-1)
+    sketches = np.bincount(cell[is_valid]*N_SKETCH_BINS + bins, minlength=len(cube)*N_SKETCH_BINS)
+
+    cube['sketch'] = list(sketches.reshape(len(cube), N_SKETCH_BINS))
+    cube['source_hash'] = source_hash
+
+    return cube
+
+
+
+'''
+    This function will aggregate the cube cells up to the given keys.
+    cube : Cube as returned by build_cube/refresh_cube (or a part of it)
+    by : Subset of CUBE_KEYS to keep e.g. ['year', 'pollutant']
+    Returns DataFrame having columns by + CUBE_MEASURES + ['mean']
+'''
+def rollup(cube, by):
+
+    grouped = cube.groupby(by, sort=True)
+    rolled = grouped.agg(rows=('rows', 'sum'), count=('count', 'sum'), sum=('sum', 'sum'),
+                         min=('min', 'min'), max=('max', 'max')).reset_index()
+
+    cell = grouped.ngroup().to_numpy()
+    sketches = np.zeros((len(rolled), N_SKETCH_BINS), dtype='int64')
+    if len(cube) > 0:
+        np.add.at(sketches, cell, np.stack(cube['sketch'].to_numpy()))
+
+    rolled['sketch'] = list(sketches)
+    rolled['mean'] = rolled['sum'] / rolled['count'].where(rolled['count'] > 0)
+
+    return rolled
+
+
+
+'''
+    This function will estimate quantiles of the readings summarised by one sketch.
+    The position inside a bin is interpolated linearly, and estimates are kept within [vmin, vmax].
+    sketch : Histogram counts over SKETCH_EDGES
+    quantiles : List of quantiles in [0, 1]
+    vmin, vmax : Minimum and maximum reading of the cell
+    Returns numpy array of estimates (NaN if the sketch is empty)
+'''
+def sketch_quantiles(sketch, quantiles, vmin, vmax):
+
+    sketch = np.asarray(sketch, dtype='float64')
+    total = sketch.sum()
+    if total == 0:
+        return np.full(len(quantiles), np.nan)
+
+    cumulative = np.cumsum(sketch)
+    targets = np.asarray(quantiles, dtype='float64') * total
+    bins = np.minimum(np.searchsorted(cumulative, targets, side='left'), N_SKETCH_BINS-1)
+    below = cumulative[bins] - sketch[bins]
+    fraction = np.where(sketch[bins] > 0, (targets - below) / np.maximum(sketch[bins], 1), 0.0)
+
+    estimates = SKETCH_EDGES[bins] + fraction * (SKETCH_EDGES[bins+1] - SKETCH_EDGES[bins])
+
+    return np.clip(estimates, vmin, vmax)
+
+
+
+'''
+    This function will read the cube stored at cube_path and rebuild only the cells of the years whose csv
+    file is new or has changed since the last refresh, all of them if SCHEMA_VERSION has changed. Years whose file was removed are dropped.
+    data_dir : Directory containing cpcb_dly_aq_delhi-<year>.csv files
+    cube_path : File in which the cube is stored
+    data : DataFrame having the unified schema (plain or compact) of all the files of data_dir, if already
+           loaded (e.g. by load_cpcb_data), stale years are then built from it instead of parsing their
+           csv file again (None by default)
+    Returns the up to date cube
+'''
+def refresh_cube(data_dir=DATA_DIR, cube_path=CUBE_PATH, data=None):
+
+    year_files = list_year_files(data_dir)
+    hashes = {year: file_hash(file_path) for year, file_path in year_files}
+
+    if Path(cube_path).is_file():
+        cube = read_columnar(cube_path)
+        stored_hashes = cube.groupby('year')['source_hash'].first().to_dict()
+    else:
+        cube = None
+        stored_hashes = {}
+
+    stale_files = [(year, file_path) for year, file_path in year_files if stored_hashes.get(year) != hashes[year]]
+    removed_years = set(stored_hashes) - set(hashes)
+
+    if cube is not None and len(stale_files) == 0 and len(removed_years) == 0:
+        return cube
+
+    parts = []
+    for year, file_path in stale_files:
+        year_data = read_year_csv(file_path, year) if data is None else data[data['year'] == year]
+        parts.append(build_cube(year_data, hashes[year]))
+    if cube is not None:
+        stale_years = set(year for year, file_path in stale_files) | removed_years
+        parts.insert(0, cube[~cube['year'].isin(stale_years)])
+
+    if len(parts) > 0:
+        cube = pd.concat(parts, ignore_index=True)
+    else:
+        cube = build_cube(load_years([]))
+    cube = cube.sort_values(CUBE_KEYS, ignore_index=True)
+
+    write_columnar(cube, cube_path)
+
+    return cube
+
+
+
+'''
+    This function will give the number of raw rows per year, as plotted by the yearly trend plot.
+    Returns Series indexed by year
+'''
+def yearly_row_counts(cube):
+
+    # Every raw row is counted once for each pollutant, so the rows of any one pollutant are enough
+    rows = cube[cube['pollutant'] == POLLUTANT_COLUMNS[0]]
+
+    return rows.groupby('year')['rows'].sum()
+
+
+
+'''
+    This function will give box statistics of a pollutant per station in a year, for create_box_plot with
+    opts['precomputed_stats'] = True. Quartiles come from the sketches and whiskers reach 1.5 IQR beyond
+    the box (never past the extreme readings), so both are approximate.
+    cube : Cube as returned by refresh_cube
+    year : Year of interest
+    pollutant : Column of the pollutant e.g. 'NO2'
+    Returns (box_stats, station_labels), stations having no reading of the pollutant are left out
+'''
+def cube_box_plot_stats(cube, year, pollutant):
+
+    cells = cube[(cube['year'] == year) & (cube['pollutant'] == pollutant) & (cube['count'] > 0)]
+    per_station = rollup(cells, ['station'])
+
+    box_stats = []
+    station_labels = []
+    for row in per_station.itertuples(index=False):
+        q1, median, q3 = sketch_quantiles(row.sketch, [0.25, 0.5, 0.75], row.min, row.max)
+        iqr = q3 - q1
+        box_stats.append({'label': row.station, 'mean': row.mean, 'med': median, 'q1': q1, 'q3': q3,
+                          'whislo': max(row.min, q1 - 1.5*iqr), 'whishi': min(row.max, q3 + 1.5*iqr),
+                          'fliers': []})
+        station_labels.append(row.station)
+
+    return box_stats, station_labels
+
+
+
+'''
+    This function will reduce a stream of chunks (e.g. from AirQualityData.iter_chunks) to per group
+    count/sum/min/max/mean and a sketch, holding only one chunk and the running totals in memory.
+    chunks : Iterable of DataFrames having the unified schema
+    by : Subset of CUBE_KEYS to group by (['year', 'pollutant'] by default)
+    Returns DataFrame as returned by rollup, use add_quantiles on it for online quantile estimates
+'''
+def stream_rollup(chunks, by=['year', 'pollutant']):
+
+    totals = None
+    for chunk in chunks:
+        part = rollup(build_cube(chunk), by)
+        if totals is not None:
+            part = rollup(pd.concat([totals, part], ignore_index=True), by)
+        totals = part
+
+    if totals is None:
+        totals = rollup(build_cube(load_years([])), by)
+
+    return totals
+
+
+
+'''
+    This function will add estimated quantiles of every group to a rolled up cube.
+    rolled : DataFrame as returned by rollup/stream_rollup
+    quantiles : List of quantiles in [0, 1] ([0.25, 0.5, 0.75] by default)
+    Returns copy of rolled having a column 'quantile_<q>' per quantile
+'''
+def add_quantiles(rolled, quantiles=[0.25, 0.5, 0.75]):
+
+    rolled = rolled.copy()
+    estimates = [sketch_quantiles(row.sketch, quantiles, row.min, row.max) for row in rolled.itertuples(index=False)]
+    estimates = np.array(estimates).reshape(len(rolled), len(quantiles))
+
+    for i in range(len(quantiles)):
+        rolled['quantile_'+str(quantiles[i])] = estimates[:, i]
+
+    return rolled
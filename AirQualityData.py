@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we will read the yearly CPCB air quality csv files of Delhi (1987 to 2015) into one
+    table having a unified schema.
+    The headers of these files drift over the years ('SPM' vs 'PM 2.5', 'Location of Monitoring Station'
+    missing before 2004, 'Stn Code' missing from 2005 to 2009), every file is mapped onto UNIFIED_COLUMNS
+    and missing columns are filled with NA.
+    As the raw files never change, the unified table is cached once as a columnar (Arrow IPC) file keyed
+    on the hash of the csv contents, and later runs memory-map it instead of re-parsing the text.
+'''
+
+
+
+import re
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from Profiling import profiled
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+COLUMNAR_SUFFIX = '.arrow' if feather is not None else '.pkl'
+
+
+
+DATA_DIR = Path(__file__).resolve().parent / 'DelhiAirQualityData' / 'csv'
+CACHE_DIR = Path(__file__).resolve().parent / 'DelhiAirQualityData' / 'cache'
+
+# Bump this whenever the unified schema changes, so that old cache files are not reused
+SCHEMA_VERSION = 2
+
+FILE_NAME_PATTERN = re.compile(r'^cpcb_dly_aq_delhi-(\d{4})\.csv$')
+
+# Conventions followed by 'Sampling Date' strings, see parse_sampling_dates
+DAILY_DATE_FORMATS = [(r'^\d{1,2}/\d{1,2}/\d{4}$', '%d/%m/%Y'), (r'^\d{2}-\d{2}-\d{2}$', '%d-%m-%y')]
+MONTHLY_CODE_PATTERN = r'^[A-Za-z]+ - M(?P<month>\d{2})(?P<year>\d{4})$'
+MONTHLY_NAME_PATTERN = r'^(?P<month_name>[A-Za-z]+)_(?P<year>\d{4})$'
+MONTH_NUMBERS = {'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6, 'july': 7,
+                 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12, 'annual': 13}
+
+STATION_COLUMN = 'Location of Monitoring Station'
+METADATA_COLUMNS = ['State', 'City/Town/Village/Area', STATION_COLUMN, 'Agency', 'Type of Location']
+POLLUTANT_COLUMNS = ['SO2', 'NO2', 'RSPM/PM10', 'SPM', 'PM 2.5']
+UNIFIED_COLUMNS = ['year', 'Stn Code', 'Sampling Date', 'date', 'granularity'] + METADATA_COLUMNS + POLLUTANT_COLUMNS
+
+# Rows recorded without a monitoring station (all the years before 2004) are kept under this station
+# wherever rows are grouped by station
+UNKNOWN_STATION = 'Unknown station'
+
+UNIFIED_DTYPES = {'year': 'int64', 'Stn Code': 'Int64', 'Sampling Date': 'string',
+                  'date': 'datetime64[ns]', 'granularity': 'string'}
+UNIFIED_DTYPES.update({column: 'string' for column in METADATA_COLUMNS})
+UNIFIED_DTYPES.update({column: 'float64' for column in POLLUTANT_COLUMNS})
+
+# Compact in memory representation, see compact_data
+COMPACT_DTYPES = {'year': 'int16', 'Stn Code': 'Int32', 'Sampling Date': 'category', 'date': 'datetime64[ns]', 'granularity': 'category'}
+COMPACT_DTYPES.update({column: 'category' for column in METADATA_COLUMNS})
+COMPACT_DTYPES.update({column: 'Float32' for column in POLLUTANT_COLUMNS})
+
+
+
+'''
+    This function will list all the yearly csv files present in data_dir.
+    data_dir : Directory containing cpcb_dly_aq_delhi-<year>.csv files
+    Returns list of (year, file_path) sorted by year
+'''
+def list_year_files(data_dir=DATA_DIR):
+
+    year_files = []
+    for file_path in Path(data_dir).iterdir():
+        match = FILE_NAME_PATTERN.match(file_path.name)
+        if match is not None and file_path.is_file():
+            year_files.append((int(match.group(1)), file_path))
+
+    return sorted(year_files)
+
+
+
+'''
+    This function will convert a column of 'Sampling Date' strings into dates, in one vectorized pass.
+    The files use the following conventions (sometimes more than one inside the same file) :
+        - daily : 'd/m/yyyy' (1987 to 2013) and 'dd-mm-yy' (2003 onwards)
+        - monthly : 'January - M011990' (1990 to 2002) and 'January_1995', dated to the first day of the month
+        - annual : 'Annual - M132002' and 'Annual_1995', dated to the first day of the year
+    date_strs : Collection of 'Sampling Date' strings
+    Returns DataFrame (with the index of date_strs) having columns
+        - date : datetime64 value of the date, NaT if the string follows none of the conventions
+        - granularity : 'daily'/'monthly'/'annual' sampling granularity of the row, NA if not parsed
+'''
+def parse_sampling_dates(date_strs):
+
+    date_strs = pd.Series(date_strs, dtype='string')
+
+    # Many rows share a date, so every distinct string is parsed once and the result is taken back to the rows
+    codes, distinct_strs = pd.factorize(date_strs)
+    parsed = _parse_distinct_dates(pd.Series(distinct_strs, dtype='string'))
+
+    # Missing strings have code -1, which takes the trailing NaT/NA
+    dates = np.append(parsed['date'].to_numpy(), np.datetime64('NaT', 'ns'))[codes]
+    granularity = np.append(parsed['granularity'].to_numpy(dtype=object), pd.NA)[codes]
+
+    return pd.DataFrame({'date': pd.Series(dates, index=date_strs.index, dtype='datetime64[ns]'),
+                         'granularity': pd.Series(granularity, index=date_strs.index, dtype='string')})
+
+
+
+def _parse_distinct_dates(date_strs):
+
+    date_strs = date_strs.str.strip()
+
+    # Daily readings, each convention is parsed with its own fixed format on the strings following it
+    conditions, dates, granularity = [], [], []
+    for pattern, date_format in DAILY_DATE_FORMATS:
+        is_match = date_strs.str.match(pattern).to_numpy(dtype=bool, na_value=False)
+        conditions.append(is_match)
+        dates.append(pd.to_datetime(date_strs.where(is_match), format=date_format, errors='coerce').to_numpy(dtype='datetime64[ns]'))
+        granularity.append('daily')
+
+    # Monthly and annual aggregates, month 13 stands for the whole year
+    coded = date_strs.str.extract(MONTHLY_CODE_PATTERN)
+    named = date_strs.str.extract(MONTHLY_NAME_PATTERN)
+    month = pd.to_numeric(coded['month'], errors='coerce').fillna(named['month_name'].str.lower().map(MONTH_NUMBERS))
+    year = pd.to_numeric(coded['year'], errors='coerce').fillna(pd.to_numeric(named['year'], errors='coerce'))
+    month = month.to_numpy(dtype='float64', na_value=np.nan)
+    year = year.to_numpy(dtype='float64', na_value=np.nan)
+
+    is_monthly = (month >= 1) & (month <= 12)
+    is_annual = month == 13
+    # Months since 1970-01, the first month of the year for annual aggregates
+    months = np.where(is_monthly | is_annual, (year - 1970) * 12 + np.where(is_monthly, month - 1, 0), 0)
+    month_start = months.astype('int64').astype('datetime64[M]').astype('datetime64[ns]')
+
+    conditions += [is_monthly, is_annual]
+    dates += [month_start, month_start]
+    granularity += ['monthly', 'annual']
+
+    # Later conventions take precedence over earlier ones
+    dates = np.select(conditions[::-1], dates[::-1], default=np.datetime64('NaT', 'ns'))
+    granularity = np.select(conditions[::-1], granularity[::-1], default=None).astype(object)
+    granularity[np.isnat(dates)] = pd.NA
+
+    return pd.DataFrame({'date': pd.Series(dates, index=date_strs.index, dtype='datetime64[ns]'),
+                         'granularity': pd.Series(granularity, index=date_strs.index, dtype='string')})
+
+
+
+'''
+    This function will map a raw yearly frame onto the unified schema.
+    raw_data : DataFrame as read from one yearly csv file
+    year : Year to which the file corresponds
+    Returns DataFrame having columns UNIFIED_COLUMNS with UNIFIED_DTYPES
+'''
+def unify_schema(raw_data, year):
+
+    # Headers are quoted in some years, strip anything left around the names
+    raw_data = raw_data.rename(columns=lambda column: column.strip().strip('"'))
+
+    data = raw_data.reindex(columns=UNIFIED_COLUMNS)
+    data['year'] = year
+    data[['date', 'granularity']] = parse_sampling_dates(data['Sampling Date'])
+
+    # Pollutant columns occasionally contain non numeric markers, these are treated as missing
+    for column in POLLUTANT_COLUMNS:
+        data[column] = pd.to_numeric(data[column], errors='coerce')
+
+    return data.astype(UNIFIED_DTYPES)
+
+
+
+'''
+    This function will read one yearly csv file into the unified schema.
+    file_path : Path of the csv file
+    year : Year to which the file corresponds
+'''
+@profiled(category='io', describe=lambda file_path, year: {'year': year})
+def read_year_csv(file_path, year):
+
+    return unify_schema(pd.read_csv(file_path), year)
+
+
+
+'''
+    This function will read the given yearly csv files, one year per task, and concatenate them.
+    year_files : List of (year, file_path) as returned by list_year_files
+    max_workers : Number of processes parsing the files in parallel, 1 parses them in this process (1 by default)
+    Returns DataFrame having columns UNIFIED_COLUMNS, rows ordered as year_files irrespective of max_workers
+'''
+def load_years(year_files, max_workers=1):
+
+    if max_workers is None or max_workers < 1:
+        raise ValueError("max_workers should be a positive integer, got "+str(max_workers))
+
+    years = [year for year, file_path in year_files]
+    file_paths = [file_path for year, file_path in year_files]
+
+    if max_workers == 1 or len(year_files) <= 1:
+        frames = [read_year_csv(file_path, year) for year, file_path in year_files]
+    else:
+        # executor.map yields results in the order of its inputs, so the output does not depend on scheduling
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(read_year_csv, file_paths, years))
+
+    if len(frames) == 0:
+        return unify_schema(pd.DataFrame(columns=UNIFIED_COLUMNS), 0)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+
+'''
+    This function will read the yearly csv files lazily, chunksize rows at a time, in the unified schema.
+    Only one chunk is resident at a time, so memory stays bounded whatever be the size of the corpus.
+    data_dir : Directory containing cpcb_dly_aq_delhi-<year>.csv files
+    chunksize : Maximum number of rows per chunk (100000 by default)
+    year_files : List of (year, file_path) to read instead of the files of data_dir (None by default)
+    Yields DataFrames having columns UNIFIED_COLUMNS, in year order, a chunk never spans two files
+'''
+def iter_chunks(data_dir=DATA_DIR, chunksize=100000, year_files=None):
+
+    if chunksize is None or chunksize < 1:
+        raise ValueError("chunksize should be a positive integer, got "+str(chunksize))
+
+    if year_files is None:
+        year_files = list_year_files(data_dir)
+
+    for year, file_path in year_files:
+        with pd.read_csv(file_path, chunksize=chunksize) as reader:
+            for raw_chunk in reader:
+                yield unify_schema(raw_chunk, year)
+
+
+
+'''
+    This function will compute the hash of contents of all the given yearly files.
+    Any change in the csv files (or in SCHEMA_VERSION) results in a new key and so in a new cache file.
+'''
+def corpus_hash(year_files):
+
+    digest = hashlib.sha256(('schema-v'+str(SCHEMA_VERSION)).encode())
+    for year, file_path in year_files:
+        digest.update(str(year).encode())
+        digest.update(Path(file_path).read_bytes())
+
+    return digest.hexdigest()[:16]
+
+
+
+'''
+    This function will read a table written by write_columnar, memory mapping it when pyarrow is available.
+'''
+def read_columnar(file_path):
+
+    if feather is not None:
+        # Memory mapping avoids copying the file before converting it to pandas
+        return feather.read_table(str(file_path), memory_map=True).to_pandas()
+
+    with open(file_path, 'rb') as columnar_file:
+        return pickle.load(columnar_file)
+
+
+
+'''
+    This function will write a DataFrame as an uncompressed Arrow IPC file (a pickle if pyarrow is missing).
+    The file is written under a temporary name first, so an interrupted run never leaves a broken file.
+'''
+def write_columnar(data, file_path):
+
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = file_path.with_name(file_path.name+'.tmp')
+    if feather is not None:
+        feather.write_feather(data, str(tmp_path), compression='uncompressed')
+    else:
+        with open(tmp_path, 'wb') as columnar_file:
+            pickle.dump(data, columnar_file, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(file_path)
+
+
+
+'''
+    This function will compute the hash of contents of one file, as read in the unified schema.
+    A change in the file (or in SCHEMA_VERSION) results in a new hash.
+'''
+def file_hash(file_path):
+
+    digest = hashlib.sha256(('schema-v'+str(SCHEMA_VERSION)).encode())
+    digest.update(Path(file_path).read_bytes())
+
+    return digest.hexdigest()[:16]
+
+
+
+def _cache_path(cache_dir, key, compact=False):
+
+    return Path(cache_dir) / ('cpcb_dly_aq_delhi-'+key+('-compact' if compact else '')+COLUMNAR_SUFFIX)
+
+
+def _write_cache(data, cache_path, key):
+
+    write_columnar(data, cache_path)
+
+    # Removing cache files of older versions of the corpus, the unified and compact files of key are both kept
+    for old_path in cache_path.parent.glob('cpcb_dly_aq_delhi-*'):
+        if not old_path.name.startswith('cpcb_dly_aq_delhi-'+key):
+            old_path.unlink(missing_ok=True)
+
+
+
+'''
+    This function will convert a DataFrame having the unified schema to a compact representation :
+        - 'Sampling Date', 'granularity' and the METADATA_COLUMNS (State, station, agency, ...) which repeat the same
+          few strings on every row become categoricals (dictionary encoded)
+        - pollutant readings, being small integers or one decimal values, become Float32 having a mask for NA
+        - 'year' becomes int16 and 'Stn Code' nullable Int32, 'date' stays datetime64
+    This takes about a quarter of the memory of the unified schema, and grouping/filtering on the categorical
+    columns works on their integer codes. Columns of data not in COMPACT_DTYPES are left as they are.
+    Frames which are compact already (e.g. read back from the compact cache) are returned as they are.
+'''
+def compact_data(data):
+
+    data = data.astype({column: dtype for column, dtype in COMPACT_DTYPES.items() if column in data.columns})
+
+    # Arrow gives categories back as 'str', they are kept as 'string' like the columns of the unified schema
+    for column, dtype in COMPACT_DTYPES.items():
+        if dtype == 'category' and column in data.columns and str(data[column].cat.categories.dtype) != 'string':
+            categories = pd.CategoricalDtype(data[column].cat.categories.astype('string'))
+            data[column] = pd.Series(pd.Categorical.from_codes(data[column].cat.codes, dtype=categories), index=data.index)
+
+    return data
+
+
+
+'''
+    This function will give the readings of a pollutant column as a float64 numpy array, NaN for missing readings.
+    Float32 readings of compact data are rounded to the 7 significant digits float32 keeps, which gives back
+    exactly the decimal value read from the csv file (e.g. 12.3 rather than 12.300000190734863), so that
+    aggregates do not depend on the representation the readings come from.
+'''
+def reading_values(readings):
+
+    values = readings.to_numpy(dtype='float64', na_value=np.nan)
+    if readings.dtype not in ('float32', 'Float32'):
+        return values
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        decimals = np.clip(6 - np.floor(np.log10(np.abs(values))), 0, 15)
+    scale = 10.0 ** np.where(np.isfinite(decimals), decimals, 0)
+
+    return np.round(values * scale) / scale
+
+
+
+'''
+    This function will read all the yearly csv files into one DataFrame having the unified schema.
+    data_dir : Directory containing cpcb_dly_aq_delhi-<year>.csv files
+    cache_dir : Directory where the columnar cache is kept
+    use_cache : If this is False csv files are always parsed and no cache is written (True by default)
+    max_workers : Number of processes used to parse the csv files when there is no cache (1 by default)
+    compact : If this is True the data is returned in the representation of compact_data (False by default).
+              The compact representation is cached in a file of its own (Arrow keeps dictionary encoded and
+              float32 columns as they are), so that once cached it is read without building the unified frame
+    Returns DataFrame having columns UNIFIED_COLUMNS, rows ordered by year and then by position in file
+'''
+def load_cpcb_data(data_dir=DATA_DIR, cache_dir=CACHE_DIR, use_cache=True, max_workers=1, compact=False):
+
+    year_files = list_year_files(data_dir)
+
+    data = None
+    if use_cache:
+        key = corpus_hash(year_files)
+        cache_path = _cache_path(cache_dir, key, compact)
+        if cache_path.is_file():
+            data = read_columnar(cache_path)
+            return compact_data(data) if compact else data
+
+        # The compact cache is derived from the unified one if that one is there already
+        unified_path = _cache_path(cache_dir, key)
+        if compact and unified_path.is_file():
+            data = read_columnar(unified_path)
+
+    if data is None:
+        data = load_years(year_files, max_workers=max_workers)
+        if use_cache:
+            _write_cache(data, _cache_path(cache_dir, key), key)
+
+    if compact:
+        data = compact_data(data)
+        if use_cache:
+            _write_cache(data, cache_path, key)
+
+    return data
+
+
+
+'''
+    This function will partition the rows of data by monitoring station in a single sort-and-split pass.
+    data : DataFrame having the unified schema (or any DataFrame having station_column)
+    station_column : Column identifying the station, By Default STATION_COLUMN
+    Returns dict of station -> array of row positions, stations in order of first appearance in data.
+    Rows without a station are left out. The partition can be reused for every pollutant of the same data.
+'''
+def partition_by_station(data, station_column=STATION_COLUMN):
+
+    codes, stations = pd.factorize(data[station_column])
+
+    # Stable sort keeps rows of a station in the order they appear in data
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(stations))
+    order = order[np.count_nonzero(codes < 0):]
+
+    return dict(zip(stations, np.split(order, np.cumsum(counts)[:-1])))
+
+
+
+'''
+    This function will collect the readings of a pollutant per station, as expected by create_box_plot.
+    data : DataFrame having the unified schema
+    pollutant : Column of the pollutant e.g. 'NO2'
+    partition : Result of partition_by_station(data), computed here if None (None by default)
+    Returns (box_plot_data, station_labels), stations having no reading of the pollutant are left out.
+    Only missing readings of the pollutant itself are dropped, not rows missing some other pollutant.
+'''
+def station_box_plot_data(data, pollutant, partition=None):
+
+    if partition is None:
+        partition = partition_by_station(data)
+
+    readings = reading_values(data[pollutant])
+
+    box_plot_data = []
+    station_labels = []
+    for station, positions in partition.items():
+        station_readings = readings[positions]
+        station_readings = station_readings[~np.isnan(station_readings)]
+        if len(station_readings) > 0:
+            box_plot_data.append(station_readings)
+            station_labels.append(station)
+
+    return box_plot_data, station_labels
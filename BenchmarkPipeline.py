@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we will benchmark the stages of the plotting pipeline : ingestion of the csv files,
+    transformation of the data (dates, per station partitioning) and rendering of the plots.
+    Every stage is run on the bundled 1987 to 2015 csv files and on synthetic corpora having the same files
+    and schemas, with every data row repeated scale times (each replica having other dates and station names).
+    Wall time (best of repeats) and peak memory are reported per stage and saved as JSON, which can be compared
+    with the JSON of an earlier run to spot regressions.
+    Peak memory is the growth of the peak resident set size (RSS) of a forked process running the stage, so it
+    includes memory allocated outside of Python (Arrow buffers, matplotlib canvases). Python allocations alone,
+    as traced by tracemalloc, are reported too.
+
+    Usage : python BenchmarkPipeline.py --scales 1 10 100 --output benchmark_results.json [--compare old.json]
+'''
+
+
+
+import gc
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import calendar
+import tempfile
+import tracemalloc
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from AirQualityData import (DATA_DIR, STATION_COLUMN, list_year_files, load_years, load_cpcb_data, parse_sampling_dates,
+                            partition_by_station, station_box_plot_data)
+from PlotUtils import create_line_plot, create_scatter_plot, create_box_plot
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+
+'''
+    This function will write a synthetic corpus in out_dir, having every yearly csv file of data_dir with its
+    data rows repeated scale times (headers, and so schemas, are unchanged).
+    Replica k (counting from 0) has its sampling dates shifted k years back and its station names suffixed
+    with ' #k', so the number of distinct dates and stations grows with the corpus as it would for real data.
+    Returns out_dir
+'''
+def make_synthetic_corpus(data_dir, out_dir, scale):
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    for year, file_path in list_year_files(data_dir):
+        # Read as strings, so that values are written back as they are
+        raw_data = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+        raw_data = raw_data.rename(columns=lambda column: column.strip().strip('"'))
+
+        replicas = []
+        for k in range(scale):
+            replica = raw_data.copy()
+            if k > 0:
+                replica['Sampling Date'] = _shift_date_years(replica['Sampling Date'], k)
+                if STATION_COLUMN in replica:
+                    stations = replica[STATION_COLUMN]
+                    replica[STATION_COLUMN] = stations.where(stations.str.strip() == '', stations+' #'+str(k))
+            replicas.append(replica)
+
+        pd.concat(replicas, ignore_index=True).to_csv(out_dir / file_path.name, index=False)
+
+    return out_dir
+
+
+# Conventions of 'Sampling Date' strings (see AirQualityData.parse_sampling_dates) as (pattern having groups
+# prefix, day, month, year and suffix, separator of day, month and year)
+_DATE_YEAR_PATTERNS = [(r'^(\s*)(\d{1,2})/(\d{1,2})/(\d{4})(\s*)$', '/'), (r'^(\s*)(\d{2})-(\d{2})-(\d{2})(\s*)$', '-'),
+                       (r'^(.*M\d{2})()()(\d{4})(\s*)$', ''), (r'^(.*_)()()(\d{4})(\s*)$', '')]
+
+
+def _shift_date_year(date_str, shift):
+
+    for pattern, separator in _DATE_YEAR_PATTERNS:
+        match = re.match(pattern, date_str)
+        if match is None:
+            continue
+        prefix, day, month, year, suffix = match.groups()
+        if len(year) == 2:
+            # Two digit years are read with the %y convention : 69-99 are 19xx, 00-68 are 20xx
+            short_year = (int(year) - shift) % 100
+            full_year, year = (1900 if short_year >= 69 else 2000) + short_year, '{:02d}'.format(short_year)
+        else:
+            full_year = int(year) - shift
+            year = str(full_year)
+        # 29th February exists only in leap years
+        if day != '' and int(day) == 29 and int(month) == 2 and not calendar.isleap(full_year):
+            day = '28'
+        if day != '':
+            return prefix+day+separator+month+separator+year+suffix
+        return prefix+year+suffix
+
+    return date_str
+
+
+'''
+    This function will shift the year of 'Sampling Date' strings by shift years back, in their own convention.
+    Strings following no known convention are kept as they are.
+'''
+def _shift_date_years(date_strs, shift):
+
+    codes, distinct_strs = pd.factorize(date_strs)
+    shifted = np.array([_shift_date_year(date_str, shift) for date_str in distinct_strs], dtype=object)
+
+    return pd.Series(shifted[codes], index=date_strs.index)
+
+
+
+def _max_rss_bytes():
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+
+def _run_in_child(stage_function, connection):
+
+    try:
+        # The peak RSS of a forked process starts from its RSS at fork time
+        rss_before = _max_rss_bytes()
+        stage_function()
+        connection.send((_max_rss_bytes() - rss_before, None))
+    except BaseException as error:
+        connection.send((None, repr(error)))
+    finally:
+        connection.close()
+
+
+
+'''
+    This function will run stage_function once in a forked process and measure the growth of its peak resident
+    set size, which covers every allocation of the stage (Python objects, numpy/Arrow buffers, figures).
+    Pages of the parent (library code, shared data) which the stage touches for the first time in the child
+    count too, so even small stages show a few MB.
+    Returns peak memory in bytes, None where fork or the resource module is not available (e.g. Windows)
+'''
+def measure_peak_rss(stage_function):
+
+    if resource is None or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_in_child, args=(stage_function, sender))
+    process.start()
+    sender.close()
+    try:
+        peak_bytes, error = receiver.recv()
+    except EOFError:
+        # The process died without reporting, e.g. killed for running out of memory
+        peak_bytes, error = None, "process died"
+    process.join()
+    if error == "process died":
+        error = error+" with exit code "+str(process.exitcode)
+
+    if error is not None:
+        raise RuntimeError("Stage failed while measuring its memory : "+error)
+
+    return max(peak_bytes, 0)
+
+
+
+'''
+    This function will run stage_function repeat times.
+    Returns (best wall time in seconds, peak memory in bytes of one run as measured by measure_peak_rss,
+             peak memory allocated by Python in bytes during one run as traced by tracemalloc, value of the last run)
+    Peak memory falls back to the tracemalloc one where measure_peak_rss is not available.
+'''
+def measure(stage_function, repeat):
+
+    best_seconds = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        value = stage_function()
+        seconds = time.perf_counter() - start
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+
+    # Memory is traced in a separate run, as tracing slows allocations down
+    gc.collect()
+    tracemalloc.start()
+    value = stage_function()
+    current, traced_peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    gc.collect()
+    peak_bytes = measure_peak_rss(stage_function)
+    if peak_bytes is None:
+        peak_bytes = traced_peak_bytes
+
+    return best_seconds, peak_bytes, traced_peak_bytes, value
+
+
+
+'''
+    These functions are the stages being benchmarked, the legacy_ ones reproduce the way GeneratingPlots.py
+    used to do the same work, so that both can be compared.
+'''
+def legacy_ingestion(data_dir):
+
+    year_data = []
+    for year, file_path in list_year_files(data_dir):
+        year_data.append(pd.read_csv(file_path))
+
+    return year_data
+
+
+def legacy_date_parsing(date_strs):
+
+    return [datetime.strptime(date_str, "%d-%m-%y").date() for date_str in date_strs]
+
+
+def legacy_station_masking(data, pollutant):
+
+    box_plot_data = []
+    for station in data['Location of Monitoring Station'].unique():
+        station_data = data[data['Location of Monitoring Station'] == station].dropna()
+        if len(station_data[pollutant]) > 0:
+            box_plot_data.append(station_data[pollutant])
+
+    return box_plot_data
+
+
+def render_line(data, out_dir):
+
+    row_counts = data.groupby('year').size()
+    create_line_plot(list(row_counts.index), list(row_counts.values),
+                     {'save_fig': str(Path(out_dir) / 'line.png'), 'show_fig': False, 'close_fig': True})
+
+
+def render_scatter(data, pollutant, out_dir):
+
+    focus_data = data[['date', pollutant]].dropna()
+    create_scatter_plot(focus_data['date'], focus_data[pollutant],
+                        {'save_fig': str(Path(out_dir) / 'scatter.png'), 'show_fig': False, 'close_fig': True, 'xtick_rotation': 60})
+
+
+def render_box(data, pollutant, out_dir):
+
+    box_plot_data, station_labels = station_box_plot_data(data, pollutant)
+    create_box_plot(box_plot_data, {'save_fig': str(Path(out_dir) / 'box.png'), 'show_fig': False, 'close_fig': True,
+                                    'xtick_labels': station_labels, 'xtick_rotation': 90, 'showfliers': False})
+
+
+
+'''
+    This function will benchmark every stage on the corpus of data_dir.
+    Returns list of dicts having stage, seconds, peak_bytes (RSS), traced_peak_bytes (tracemalloc) and rows
+'''
+def benchmark_corpus(data_dir, repeat, max_workers, work_dir):
+
+    year_files = list_year_files(data_dir)
+    cache_dir = Path(work_dir) / 'cache'
+
+    data = load_years(year_files)
+    daily_dates = data.loc[data['Sampling Date'].str.match(r'^\d{2}-\d{2}-\d{2}$').fillna(False).astype(bool), 'Sampling Date']
+    station_data = data[data['Location of Monitoring Station'].notna()].dropna(axis=1, how='all')
+    pollutant = 'NO2'
+
+    # Warming the columnar cache up, so the cache hit stage really measures a hit
+    load_cpcb_data(data_dir, cache_dir)
+
+    stages = [
+        ('ingestion/legacy_read_csv_loop', len(data), lambda: legacy_ingestion(data_dir)),
+        ('ingestion/load_years_serial', len(data), lambda: load_years(year_files)),
+        ('ingestion/load_years_parallel', len(data), lambda: load_years(year_files, max_workers=max_workers)),
+        ('ingestion/load_cpcb_data_cache_hit', len(data), lambda: load_cpcb_data(data_dir, cache_dir)),
+        ('transformation/legacy_strptime', len(daily_dates), lambda: legacy_date_parsing(daily_dates)),
+        ('transformation/parse_sampling_dates', len(data), lambda: parse_sampling_dates(data['Sampling Date'])),
+        ('transformation/legacy_station_masking', len(station_data), lambda: legacy_station_masking(station_data, pollutant)),
+        ('transformation/station_partition', len(station_data), lambda: station_box_plot_data(station_data, pollutant, partition_by_station(station_data))),
+        ('rendering/create_line_plot', data['year'].nunique(), lambda: render_line(data, work_dir)),
+        ('rendering/create_scatter_plot', int(data[pollutant].notna().sum()), lambda: render_scatter(data, pollutant, work_dir)),
+        ('rendering/create_box_plot', int(station_data[pollutant].notna().sum()), lambda: render_box(station_data, pollutant, work_dir)),
+    ]
+
+    results = []
+    for stage, rows, stage_function in stages:
+        seconds, peak_bytes, traced_peak_bytes, value = measure(stage_function, repeat)
+        results.append({'stage': stage, 'rows': int(rows), 'seconds': seconds, 'peak_bytes': int(peak_bytes),
+                        'traced_peak_bytes': int(traced_peak_bytes)})
+        print("  {:45s} {:>10d} rows {:10.4f} s {:10.1f} MB RSS {:10.1f} MB traced".format(stage, rows, seconds, peak_bytes/1e6, traced_peak_bytes/1e6))
+
+    plt.close('all')
+
+    return results
+
+
+
+'''
+    This function will compare the results of this run with those of an earlier run (as saved in JSON).
+    Stages slower by more than threshold (as a ratio) are reported as regressions.
+    Returns list of (corpus, stage, old seconds, new seconds) of the regressions
+'''
+def compare_results(old_report, new_report, threshold=1.2):
+
+    old_seconds = {(result['corpus'], result['stage']): result['seconds'] for result in old_report['results']}
+
+    regressions = []
+    for result in new_report['results']:
+        key = (result['corpus'], result['stage'])
+        if key not in old_seconds:
+            continue
+        ratio = result['seconds'] / max(old_seconds[key], 1e-9)
+        print("  {:6s} {:45s} {:10.4f} s -> {:10.4f} s ({:.2f}x)".format(key[0], key[1], old_seconds[key], result['seconds'], ratio))
+        if ratio > threshold:
+            regressions.append((key[0], key[1], old_seconds[key], result['seconds']))
+
+    return regressions
+
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, transformation and rendering stages")
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help="Directory of the yearly csv files")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help="Sizes of the corpora, as multiples of the bundled one")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs per stage, the best one is kept")
+    parser.add_argument('--max-workers', type=int, default=4, help="Number of processes of the parallel ingestion stage")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file in which results are saved")
+    parser.add_argument('--compare', default=None, help="JSON file of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Slowdown ratio above which a stage is reported as a regression")
+    args = parser.parse_args(argv)
+
+    report = {'meta': {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                       'matplotlib': matplotlib.__version__, 'repeat': args.repeat, 'max_workers': args.max_workers},
+              'results': []}
+
+    work_dir = Path(tempfile.mkdtemp(prefix='aq_benchmark_'))
+    try:
+        for scale in args.scales:
+            corpus = str(scale)+'x'
+            print("Corpus "+corpus)
+            if scale == 1:
+                data_dir = Path(args.data_dir)
+            else:
+                data_dir = make_synthetic_corpus(args.data_dir, work_dir / ('csv_'+corpus), scale)
+
+            corpus_work_dir = work_dir / ('work_'+corpus)
+            corpus_work_dir.mkdir()
+            for result in benchmark_corpus(data_dir, args.repeat, args.max_workers, corpus_work_dir):
+                result['corpus'] = corpus
+                report['results'].append(result)
+
+            if scale != 1:
+                shutil.rmtree(data_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print("Results saved in "+args.output)
+
+    if args.compare is not None:
+        with open(args.compare) as compare_file:
+            old_report = json.load(compare_file)
+        print("Comparison with "+args.compare)
+        regressions = compare_results(old_report, report, args.threshold)
+        if len(regressions) > 0:
+            print(str(len(regressions))+" stage(s) slower than "+str(args.threshold)+"x")
+            return 1
+
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,205 +9,50 @@
 
 
 
-import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
-from pathlib import Path
-from datetime import datetime, date
+from PlotUtils import create_line_plot, create_scatter_plot, create_box_plot
+from AirQualityData import load_cpcb_data, partition_by_station, station_box_plot_data
+from AggregateCube import refresh_cube, yearly_row_counts
+from PollutantAnalytics import (STANDARD_LIMITS, daily_station_means, rolling_means, aqi_sub_indices,
+                                exceedance_counts, station_series)
+from RenderCache import RenderCache
+from Profiling import start_stage, end_stage
 
 
 
-'''
-    This function will create a line plot between xdata and ydata.
-    xdata : X coordinates of data points
-    ydata : Y corrdinates of data points
-    opts : Specifies list of possible options
-        - title : Specify title of the plot
-        - xlabel : Specify label of X axis of the plot
-        - ylabel : Specify label of Y axis of the plot
-        - plot_label : Specify the legend label of the plot
-        - show_fig : If this is False figure will not been shown (True by defualt)
-        - save_fig : None/<Path/NameWithExtension>
-        - reuse_last_fig : plot new data on existing axes given by (fig,ax) as value , None by default
-'''
-def create_line_plot(xdata,ydata,opts):
-    
-    title = opts.get('title',"")
-    xlabel = opts.get('xlabel',"")
-    ylabel = opts.get('ylabel',"")
-    plot_label = opts.get('plot_label',None)
-    show_fig = opts.get('show_fig',True)
-    save_fig = opts.get('save_fig',None)
-    reuse_last_fig = opts.get('reuse_last_fig',None)
-    
-    if reuse_last_fig == None:
-        fig,ax = plt.subplots()
-    else:
-        fig,ax = reuse_last_fig
-        
-    # Setting x and y axis labels
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    
-    # Plotting Data  
-    ax.plot(xdata,ydata,label=plot_label)
-    
-    # Setting Legend
-    if plot_label is not None:
-        handles, labels = ax.get_legend_handles_labels()
-        ax.legend(handles, labels)
-    
-    # Setting Title
-    ax.set_title(title)
-    
-    # Save figure according to options
-    if save_fig is not None:
-        fig.savefig(save_fig,bbox_inches='tight')
-    
-    # Show figure according to options
-    if show_fig == True:
-        plt.show()
-        
-    
+# Figures are shown unless the backend is a non interactive one. Third party backends (e.g. the inline backend of
+# Jupyter) count as interactive. In headless runs (e.g. MPLBACKEND=Agg or pdf in CI) figures whose data and options
+# did not change are copied from the render cache instead of being rendered
+try:
+    from matplotlib.backends import backend_registry, BackendFilter
+    non_interactive_backends = backend_registry.list_builtin(BackendFilter.NON_INTERACTIVE)
+except ImportError:
+    # matplotlib older than 3.9
+    from matplotlib.rcsetup import non_interactive_bk as non_interactive_backends
+show_figs = plt.get_backend().lower() not in [backend.lower() for backend in non_interactive_backends]
+render_cache = RenderCache()
 
 
-'''
-    This function will create a scatter plot between xdata and ydata.
-    xdata : X coordinates of data points
-    ydata : Y corrdinates of data points
-    opts : Specifies list of possible options
-        - title : Specify title of the plot
-        - xlabel : Specify label of X axis of the plot
-        - ylabel : Specify label of Y axis of the plot
-        - plot_label : Specify the legend label of the plot
-        - show_fig : If this is False figure will not been shown (True by defualt)
-        - save_fig : None/<Path/NameWithExtension>
-        - reuse_last_fig : plot new data on existing axes given by (fig,ax) as value , None by default
-        - xtick_rotation : Rotation of labels of x axis in case they don't fit, By Default 0
-'''
-def create_scatter_plot(xdata,ydata,opts):
-    
-    title = opts.get('title',"")
-    xlabel = opts.get('xlabel',"")
-    ylabel = opts.get('ylabel',"")
-    plot_label = opts.get('plot_label',None)
-    show_fig = opts.get('show_fig',True)
-    save_fig = opts.get('save_fig',None)
-    reuse_last_fig = opts.get('reuse_last_fig',None)
-    xtick_rotation = opts.get('xtick_rotation',0)
-    
-    
-    if reuse_last_fig == None:
-        fig,ax = plt.subplots()
-    else:
-        fig,ax = reuse_last_fig
-        
-    # Setting x and y axis labels
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    
-    # Plotting Data  
-    ax.scatter(xdata,ydata,label=plot_label)
-    
-    # Setting Legend
-    if plot_label is not None:
-        handles, labels = ax.get_legend_handles_labels()
-        ax.legend(handles, labels)
-    
-    # Setting Title
-    ax.set_title(title)
-    
-    # Rotating X Axis ticks
-    plt.xticks(rotation=xtick_rotation)
-    
-    # Save figure according to options
-    if save_fig is not None:
-        fig.savefig(save_fig,bbox_inches='tight')
-    
-    # Show figure according to options
-    if show_fig == True:
-        plt.show()
-        
-
 
 '''
-    This function will create a box plot between xdata and ydata.
-    
-    ydata : Collection(s) of data points
-    opts : Specifies list of possible options
-        - title : Specify title of the plot
-        - xlabel : Specify label of X axis of the plot
-        - ylabel : Specify label of Y axis of the plot
-        - show_fig : If this is False figure will not been shown (True by defualt)
-        - save_fig : None/<Path/NameWithExtension>
-        - reuse_last_fig : plot new data on existing axes given by (fig,ax) as value , None by default
-        - xtick_rotation : Rotation of labels of x axis in case they don't fit, By Default 0
-        - showfliers : Show outliers, By Default True
-        - xtick_labels : List of names of categories, By Default range(len(ydata))
+    **************  Understanding the amount of data points collected over the years : Line Plot ****************
 '''
-def create_box_plot(ydata,opts):
-    
-    title = opts.get('title',"")
-    xlabel = opts.get('xlabel',"")
-    ylabel = opts.get('ylabel',"")
-    show_fig = opts.get('show_fig',True)
-    save_fig = opts.get('save_fig',None)
-    reuse_last_fig = opts.get('reuse_last_fig',None)
-    xtick_rotation = opts.get('xtick_rotation',0)
-    showfliers = opts.get('showfliers',True)
-    xtick_labels = opts.get('xtick_labels',range(len(ydata)))
-    
-    if reuse_last_fig == None:
-        fig,ax = plt.subplots()
-    else:
-        fig,ax = reuse_last_fig
-        
-    # Setting x and y axis labels
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    
-    # Plotting Data  
-    ax.boxplot(ydata,showfliers=showfliers)
-    
-    
-    
-    # Setting Title
-    ax.set_title(title)
-    
-    # Rotating X Axis ticks and Setting its labels
-    ax.set_xticks(range(1,len(ydata)+1))
-    ax.set_xticklabels(xtick_labels, rotation=xtick_rotation)
-    
-    # Save figure according to options
-    if save_fig is not None:
-        fig.savefig(save_fig,bbox_inches='tight')
-    
-    # Show figure according to options
-    if show_fig == True:
-        plt.show()
-        
-    
-    
 
 
-'''
-    **************  Understanding the amount of data points collected over the years : Line Plot ****************
-'''
+# Timing of this section is recorded only if profiling is enabled (see Profiling.py)
+section = start_stage('yearly_trend_section', category='section')
 
+# Reading through all available data files (parsed once and cached in a columnar file afterwards)
+# Station/metadata columns are kept as categoricals and readings as float32 to save memory
+all_data = load_cpcb_data(compact=True)
 
-year_list = []
-no_of_data_pts = []
-year_data = []
+# Counts per year are served from the aggregate cube, which is rebuilt (from all_data) only for years whose file changed
+no_of_data_pts_per_year = yearly_row_counts(refresh_cube(data=all_data))
+year_list = list(no_of_data_pts_per_year.index)
+no_of_data_pts = list(no_of_data_pts_per_year.values)
 
-# Reading through all available data files
-for year in range(1987,2016):
-    file_path = './DelhiAirQualityData/csv/cpcb_dly_aq_delhi-'+str(year)+'.csv'
-    my_file = Path(file_path)
-    if my_file.is_file():
-        data = pd.read_csv(file_path)
-        year_list.append(year)
-        no_of_data_pts.append(data.shape[0])
-        year_data.append(data)
+# Data of the latest available year, without the columns which were not reported in that year
+data = all_data[all_data['year'] == year_list[-1]].dropna(axis=1, how='all')
 
 print("Number of raw data points measuring air pollution in Delhi available in the dataset(s)")
 
@@ -221,10 +66,15 @@ plotOptions['title'] = "Trend of data points measuring air pollution in Delhi"
 plotOptions['xlabel'] = "Year "
 plotOptions['ylabel'] = "Number of pollution data points (raw) available"
 plotOptions['save_fig'] = "number_of_data_points_yearly_trend.png"
+plotOptions['show_fig'] = show_figs
+plotOptions['close_fig'] = not show_figs
+plotOptions['render_cache'] = render_cache
 plotOptions['plot_label'] = "# data points"
 
 create_line_plot(xdata,ydata,plotOptions)
 
+end_stage(section, rows=all_data.shape[0])
+
 
 
 
@@ -243,10 +93,12 @@ pollutant = 'PM 2.5'
 
 print("Time Series analysis of concentration of "+pollutant+" in Delhi over the year "+str(year))
 
+section = start_stage('time_series_section', category='section', year=year, pollutant=pollutant)
+
 # Creating a scatter plot
-focus_data = data[['Sampling Date',pollutant]].dropna()
-list_of_date_strs = focus_data['Sampling Date']
-list_of_observation_dates = [datetime.strptime(date_str ,"%d-%m-%y").date() for date_str in list_of_date_strs ]
+# 'date' column is parsed from 'Sampling Date' while loading, whatever be the date convention of that year
+focus_data = data[['date',pollutant]].dropna()
+list_of_observation_dates = focus_data['date']
 data_for_specific_pollutant = focus_data[pollutant]
 
 xdata = list_of_observation_dates
@@ -258,11 +110,16 @@ plotOptions['title'] = "Daily variation of "+pollutant+" levels in "+str(year)+"
 plotOptions['xlabel'] = "Date "
 plotOptions['ylabel'] = "Reported concentration of "+pollutant+"(microgm/m3)"
 plotOptions['save_fig'] = "time_series_pollutant_"+pollutant+"_yr_"+str(year)+".png"
+plotOptions['show_fig'] = show_figs
+plotOptions['close_fig'] = not show_figs
+plotOptions['render_cache'] = render_cache
 plotOptions['plot_label'] = pollutant+" conc. reading taken inside Delhi"
 plotOptions['xtick_rotation'] = 60
 
 create_scatter_plot(xdata,ydata,plotOptions)
 
+end_stage(section, rows=focus_data.shape[0])
+
 
 
 
@@ -284,20 +141,11 @@ pollutant = 'NO2'
 
 print("Location wise analysis of concentration of "+pollutant+" in Delhi over the year "+str(year))
 
-list_of_locations = data['Location of Monitoring Station'].unique()
-box_plot_data = []
-box_plot_labels_of_ticks = []
+section = start_stage('location_wise_section', category='section', year=year, pollutant=pollutant)
 
-for i in range(len(list_of_locations)):
-    # Filtering data corresponding to a given station
-    station_data = data[data['Location of Monitoring Station'] == list_of_locations[i]].dropna()
-    station_data_for_specific_pollutant = station_data[pollutant]
-    
-    # If there is any valid data point left in station_data
-    if len(station_data_for_specific_pollutant)>0:
-
-        box_plot_labels_of_ticks.append(list_of_locations[i])
-        box_plot_data.append(station_data_for_specific_pollutant)
+# Rows are partitioned by station once, the same partition serves every pollutant of this year
+station_partition = partition_by_station(data)
+box_plot_data, box_plot_labels_of_ticks = station_box_plot_data(data, pollutant, station_partition)
 
 ydata = box_plot_data
 
@@ -308,6 +156,9 @@ plotOptions['title'] = "Location wise distribution of "+pollutant+" in "+str(yea
 plotOptions['xlabel'] = "Locations "
 plotOptions['ylabel'] = "Reported concentration of "+pollutant +"(microgm/m3)"
 plotOptions['save_fig'] = "location_wise_pollutant_"+pollutant+"_yr_"+str(year)+".png"
+plotOptions['show_fig'] = show_figs
+plotOptions['close_fig'] = not show_figs
+plotOptions['render_cache'] = render_cache
 # plotOptions['plot_label'] = pollutant+" conc. reading taken inside Delhi"
 plotOptions['xtick_rotation'] = 90
 plotOptions['showfliers'] = False
@@ -315,6 +166,73 @@ plotOptions['xtick_labels'] = box_plot_labels_of_ticks
 
 create_box_plot(ydata,plotOptions)
 
+end_stage(section, rows=sum(len(station_data) for station_data in box_plot_data))
+
+
+
+
+
+
+'''
+    ********** Analysing rolling means and air quality index, monitoring station wise : line plot and box plot ********
+
+    Please Note : Readings are taken on a few days a week only, rolling means are over the days having readings
+'''
+
+
+year = 2015
+station = 'Shahzada Bagh, Delhi'
+pollutant = 'RSPM/PM10'
+window = '30d'
+
+print("Rolling "+window+" mean of "+pollutant+" at "+station+" and air quality index, location wise, over the year "+str(year))
+
+section = start_stage('rolling_and_aqi_section', category='section', year=year, pollutant=pollutant)
+
+# Daily means per station, their rolling means and AQI sub-indices are computed for all years at once
+station_analytics = aqi_sub_indices(rolling_means(daily_station_means(all_data)))
+year_analytics = station_analytics[station_analytics['year'] == year]
+
+# Creating a line plot
+xdata, ydata = station_series(year_analytics, station, pollutant+' '+window)
+
+plotOptions = {}
+
+plotOptions['title'] = "Rolling "+window+" mean of "+pollutant+" at "+station+" in "+str(year)
+plotOptions['xlabel'] = "Date "
+plotOptions['ylabel'] = "Mean concentration of "+pollutant+"(microgm/m3)"
+plotOptions['save_fig'] = "rolling_mean_pollutant_"+pollutant.replace('/', '_')+"_"+window+"_yr_"+str(year)+".png"
+plotOptions['show_fig'] = show_figs
+plotOptions['close_fig'] = not show_figs
+plotOptions['render_cache'] = render_cache
+plotOptions['plot_label'] = window+" rolling mean (limit of national standard : "+str(STANDARD_LIMITS[pollutant])+")"
+
+create_line_plot(xdata,ydata,plotOptions)
+
+exceeding_days = exceedance_counts(year_analytics)
+print("Days exceeding national standards per station in "+str(year))
+print(exceeding_days[list(STANDARD_LIMITS)])
+
+# Creating a box plot
+box_plot_data, box_plot_labels_of_ticks = station_box_plot_data(year_analytics, 'AQI')
+
+plotOptions = {}
+
+plotOptions['title'] = "Location wise distribution of daily air quality index in "+str(year)
+plotOptions['xlabel'] = "Locations "
+plotOptions['ylabel'] = "Daily air quality index (AQI)"
+plotOptions['save_fig'] = "location_wise_aqi_yr_"+str(year)+".png"
+plotOptions['show_fig'] = show_figs
+plotOptions['close_fig'] = not show_figs
+plotOptions['render_cache'] = render_cache
+plotOptions['xtick_rotation'] = 90
+plotOptions['showfliers'] = False
+plotOptions['xtick_labels'] = box_plot_labels_of_ticks
+
+create_box_plot(box_plot_data,plotOptions)
+
+end_stage(section, rows=station_analytics.shape[0])
+
 
 
 
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we keep the plotting functions used by GeneratingPlots.py : Line Plot, Scatter Plot and Box Plot
+    along with a batch mode rendering many plots headlessly (without any GUI backend), optionally in parallel.
+'''
+
+
+
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from Profiling import profiled, profile_stage, annotate_stage
+
+
+
+'''
+    This function will convert coordinates to floats, dates being converted to matplotlib date numbers.
+    Dates may be datetime64 values or datetime.date/datetime.datetime objects (missing ones being None).
+    Returns (numpy array of floats, True if the coordinates were dates)
+'''
+def _as_numeric(data):
+
+    values = np.asarray(data)
+    if values.dtype.kind == 'O' and any(isinstance(value, (date, np.datetime64)) for value in values):
+        values = pd.to_datetime(values).to_numpy(dtype='datetime64[ns]')
+    if values.dtype.kind == 'M':
+        return mdates.date2num(values), True
+
+    return values.astype('float64'), False
+
+
+def _is_categorical(values):
+
+    return values.dtype.kind in 'SU' or (values.dtype.kind == 'O' and any(isinstance(value, str) for value in values))
+
+
+
+'''
+    This function will choose the points to keep when a line of many points is drawn with only n_out of them,
+    using Largest-Triangle-Three-Buckets : points are split in n_out-2 buckets and from every bucket the point
+    forming the largest triangle with the previously kept point and the average of the next bucket is kept.
+    The first and last points are always kept.
+    x, y : Numeric coordinates of points, x being in plotting order
+    n_out : Number of points to keep (at least 3)
+    Returns numpy array of indices of the kept points, in increasing order
+'''
+def lttb_indices(x, y, n_out):
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+
+    if n_out < 3:
+        raise ValueError("n_out should be at least 3, got "+str(n_out))
+    if n <= n_out:
+        return np.arange(n)
+
+    # Bucket i covers points edges[i] to edges[i+1]-1, the first and last points stay out of buckets
+    edges = np.linspace(1, n-1, n_out-1).astype('int64')
+
+    selected = np.empty(n_out, dtype='int64')
+    selected[0] = 0
+    selected[-1] = n-1
+
+    previous = 0
+    for i in range(n_out-2):
+        start, end = edges[i], edges[i+1]
+        if i+2 < len(edges):
+            next_start, next_end = edges[i+1], edges[i+2]
+        else:
+            next_start, next_end = n-1, n
+
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        # Twice the area of the triangles (previous point, candidate, average of next bucket)
+        areas = np.abs((x[previous]-next_x)*(y[start:end]-y[previous]) - (x[previous]-x[start:end])*(next_y-y[previous]))
+        previous = start + np.argmax(areas)
+        selected[i+1] = previous
+
+    return selected
+
+
+
+# Details recorded by Profiling for every call of the plotting functions
+def _describe_plot(xdata, ydata, opts):
+
+    return {'title': opts.get('title', ""), 'save_fig': opts.get('save_fig', None), 'rows': len(ydata), 'cache_hit': False}
+
+
+def _describe_box_plot(ydata, opts):
+
+    if opts.get('precomputed_stats', False) == True:
+        rows = None
+    else:
+        rows = sum(len(box_data) for box_data in ydata)
+
+    return {'title': opts.get('title', ""), 'save_fig': opts.get('save_fig', None), 'boxes': len(ydata), 'rows': rows,
+            'cache_hit': False}
+
+
+
+'''
+    This function will create a line plot between xdata and ydata.
+    xdata : X coordinates of data points
+    ydata : Y corrdinates of data points
+    opts : Specifies list of possible options
+        - title : Specify title of the plot
+        - xlabel : Specify label of X axis of the plot
+        - ylabel : Specify label of Y axis of the plot
+        - plot_label : Specify the legend label of the plot
+        - show_fig : If this is False figure will not been shown (True by defualt)
+        - save_fig : None/<Path/NameWithExtension>
+        - reuse_last_fig : plot new data on existing axes given by (fig,ax) as value , None by default
+        - close_fig : If this is True figure is closed once saved/shown, to free its memory (False by default)
+        - render_cache : RenderCache from which save_fig is copied, without rendering, if the same data and
+                         options were rendered before. Used only if show_fig is False and reuse_last_fig is None (None by default)
+        - max_points : If the line has more points than this (at least 3), it is decimated to max_points points
+                       with lttb_indices (points with missing coordinates are dropped), None by default.
+                       Categorical X coordinates (e.g. strings) are decimated on their positions
+'''
+@profiled(category='plot', describe=_describe_plot)
+def create_line_plot(xdata,ydata,opts):
+    
+    title = opts.get('title',"")
+    xlabel = opts.get('xlabel',"")
+    ylabel = opts.get('ylabel',"")
+    plot_label = opts.get('plot_label',None)
+    show_fig = opts.get('show_fig',True)
+    save_fig = opts.get('save_fig',None)
+    reuse_last_fig = opts.get('reuse_last_fig',None)
+    close_fig = opts.get('close_fig',False)
+    render_cache = opts.get('render_cache',None)
+    max_points = opts.get('max_points',None)
+    
+    if max_points is not None and max_points < 3:
+        raise ValueError("max_points should be at least 3, got "+str(max_points))
+    
+    # Skipping rendering if the same figure is in the render cache
+    cache_key = None
+    if render_cache is not None and save_fig is not None and show_fig == False and reuse_last_fig == None:
+        cache_key = render_cache.key('line',xdata,ydata,opts)
+        if render_cache.fetch(cache_key,save_fig):
+            annotate_stage(cache_hit=True)
+            return
+    
+    if reuse_last_fig == None:
+        fig,ax = plt.subplots()
+    else:
+        fig,ax = reuse_last_fig
+        
+    # Setting x and y axis labels
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    
+    # Decimating the line according to options
+    if max_points is not None and len(xdata) > max_points:
+        xvalues = np.asarray(xdata)
+        if _is_categorical(xvalues):
+            # Categories (e.g. station names) are drawn one per position, in the given order
+            x = np.arange(len(xvalues), dtype='float64')
+        else:
+            x = _as_numeric(xvalues)[0]
+        y = np.asarray(ydata, dtype='float64')
+        is_valid = np.isfinite(x) & np.isfinite(y)
+        kept = np.flatnonzero(is_valid)[lttb_indices(x[is_valid], y[is_valid], max_points)]
+        xdata = xvalues[kept]
+        ydata = y[kept]
+    
+    # Plotting Data  
+    ax.plot(xdata,ydata,label=plot_label)
+    
+    # Setting Legend
+    if plot_label is not None:
+        handles, labels = ax.get_legend_handles_labels()
+        ax.legend(handles, labels)
+    
+    # Setting Title
+    ax.set_title(title)
+    
+    # Save figure according to options
+    if save_fig is not None:
+        with profile_stage('savefig', category='plot', save_fig=save_fig):
+            fig.savefig(save_fig,bbox_inches='tight')
+        if cache_key is not None:
+            render_cache.store(cache_key,save_fig)
+    
+    # Show figure according to options
+    if show_fig == True:
+        plt.show()
+    
+    # Close figure according to options
+    if close_fig == True:
+        plt.close(fig)
+        
+    
+
+
+'''
+    This function will create a scatter plot between xdata and ydata.
+    xdata : X coordinates of data points
+    ydata : Y corrdinates of data points
+    opts : Specifies list of possible options
+        - title : Specify title of the plot
+        - xlabel : Specify label of X axis of the plot
+        - ylabel : Specify label of Y axis of the plot
+        - plot_label : Specify the legend label of the plot
+        - show_fig : If this is False figure will not been shown (True by defualt)
+        - save_fig : None/<Path/NameWithExtension>
+        - reuse_last_fig : plot new data on existing axes given by (fig,ax) as value , None by default
+        - close_fig : If this is True figure is closed once saved/shown, to free its memory (False by default)
+        - render_cache : RenderCache from which save_fig is copied, without rendering, if the same data and
+                         options were rendered before. Used only if show_fig is False and reuse_last_fig is None (None by default)
+        - xtick_rotation : Rotation of labels of x axis in case they don't fit, By Default 0
+        - max_points : If there are more points than this (at least 3), their density is drawn instead as a hexbin
+                       having about max_points hexagons (points with missing coordinates are dropped), None by default.
+                       Categorical X coordinates (e.g. strings) are drawn one position per category
+'''
+@profiled(category='plot', describe=_describe_plot)
+def create_scatter_plot(xdata,ydata,opts):
+    
+    title = opts.get('title',"")
+    xlabel = opts.get('xlabel',"")
+    ylabel = opts.get('ylabel',"")
+    plot_label = opts.get('plot_label',None)
+    show_fig = opts.get('show_fig',True)
+    save_fig = opts.get('save_fig',None)
+    reuse_last_fig = opts.get('reuse_last_fig',None)
+    close_fig = opts.get('close_fig',False)
+    render_cache = opts.get('render_cache',None)
+    xtick_rotation = opts.get('xtick_rotation',0)
+    max_points = opts.get('max_points',None)
+    
+    if max_points is not None and max_points < 3:
+        raise ValueError("max_points should be at least 3, got "+str(max_points))
+    
+    # Skipping rendering if the same figure is in the render cache
+    cache_key = None
+    if render_cache is not None and save_fig is not None and show_fig == False and reuse_last_fig == None:
+        cache_key = render_cache.key('scatter',xdata,ydata,opts)
+        if render_cache.fetch(cache_key,save_fig):
+            annotate_stage(cache_hit=True)
+            return
+    
+    # Coordinates of the density of points, converted before any figure is created
+    is_density = max_points is not None and len(xdata) > max_points
+    if is_density:
+        xvalues = np.asarray(xdata)
+        categories = None
+        if _is_categorical(xvalues):
+            # Categories (e.g. station names) get one position each, in order of appearance as ax.scatter does
+            codes, categories = pd.factorize(xvalues)
+            x, is_date = np.where(codes >= 0, codes, np.nan), False
+        else:
+            x, is_date = _as_numeric(xvalues)
+        y = np.asarray(ydata, dtype='float64')
+        is_valid = np.isfinite(x) & np.isfinite(y)
+    
+    if reuse_last_fig == None:
+        fig,ax = plt.subplots()
+    else:
+        fig,ax = reuse_last_fig
+        
+    # Setting x and y axis labels
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    
+    # Plotting Data, as a density of points according to options
+    if is_density:
+        # A hexbin of gridsize g has about g*g hexagons over the data range, hexbin needs g of 2 at least
+        gridsize = max(2, int(np.sqrt(max_points)))
+        density = ax.hexbin(x[is_valid], y[is_valid], gridsize=gridsize, mincnt=1, label=plot_label, rasterized=True)
+        fig.colorbar(density, ax=ax, label="Number of data points")
+        if is_date:
+            ax.xaxis_date()
+        if categories is not None:
+            ax.set_xticks(np.arange(len(categories)), [str(category) for category in categories])
+    else:
+        ax.scatter(xdata,ydata,label=plot_label)
+    
+    # Setting Legend
+    if plot_label is not None:
+        handles, labels = ax.get_legend_handles_labels()
+        ax.legend(handles, labels)
+    
+    # Setting Title
+    ax.set_title(title)
+    
+    # Rotating X Axis ticks
+    ax.tick_params(axis='x', labelrotation=xtick_rotation)
+    
+    # Save figure according to options
+    if save_fig is not None:
+        with profile_stage('savefig', category='plot', save_fig=save_fig):
+            fig.savefig(save_fig,bbox_inches='tight')
+        if cache_key is not None:
+            render_cache.store(cache_key,save_fig)
+    
+    # Show figure according to options
+    if show_fig == True:
+        plt.show()
+    
+    # Close figure according to options
+    if close_fig == True:
+        plt.close(fig)
+        
+
+
+'''
+    This function will create a box plot between xdata and ydata.
+    
+    ydata : Collection(s) of data points
+    opts : Specifies list of possible options
+        - title : Specify title of the plot
+        - xlabel : Specify label of X axis of the plot
+        - ylabel : Specify label of Y axis of the plot
+        - show_fig : If this is False figure will not been shown (True by defualt)
+        - save_fig : None/<Path/NameWithExtension>
+        - reuse_last_fig : plot new data on existing axes given by (fig,ax) as value , None by default
+        - close_fig : If this is True figure is closed once saved/shown, to free its memory (False by default)
+        - render_cache : RenderCache from which save_fig is copied, without rendering, if the same data and
+                         options were rendered before. Used only if show_fig is False and reuse_last_fig is None (None by default)
+        - xtick_rotation : Rotation of labels of x axis in case they don't fit, By Default 0
+        - showfliers : Show outliers, By Default True
+        - xtick_labels : List of names of categories, By Default range(len(ydata))
+        - precomputed_stats : If this is True ydata is a list of box statistics (dicts as accepted by ax.bxp)
+                              instead of data points, e.g. from AggregateCube.cube_box_plot_stats, False by default
+'''
+@profiled(category='plot', describe=_describe_box_plot)
+def create_box_plot(ydata,opts):
+    
+    title = opts.get('title',"")
+    xlabel = opts.get('xlabel',"")
+    ylabel = opts.get('ylabel',"")
+    show_fig = opts.get('show_fig',True)
+    save_fig = opts.get('save_fig',None)
+    reuse_last_fig = opts.get('reuse_last_fig',None)
+    close_fig = opts.get('close_fig',False)
+    render_cache = opts.get('render_cache',None)
+    xtick_rotation = opts.get('xtick_rotation',0)
+    showfliers = opts.get('showfliers',True)
+    xtick_labels = opts.get('xtick_labels',range(len(ydata)))
+    precomputed_stats = opts.get('precomputed_stats',False)
+    
+    # Skipping rendering if the same figure is in the render cache
+    cache_key = None
+    if render_cache is not None and save_fig is not None and show_fig == False and reuse_last_fig == None:
+        cache_key = render_cache.key('box',None,ydata,opts)
+        if render_cache.fetch(cache_key,save_fig):
+            annotate_stage(cache_hit=True)
+            return
+    
+    if reuse_last_fig == None:
+        fig,ax = plt.subplots()
+    else:
+        fig,ax = reuse_last_fig
+        
+    # Setting x and y axis labels
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    
+    # Plotting Data  
+    if precomputed_stats == True:
+        ax.bxp(ydata,showfliers=showfliers)
+    else:
+        ax.boxplot(ydata,showfliers=showfliers)
+    
+    
+    
+    # Setting Title
+    ax.set_title(title)
+    
+    # Rotating X Axis ticks and Setting its labels
+    ax.set_xticks(range(1,len(ydata)+1))
+    ax.set_xticklabels(xtick_labels, rotation=xtick_rotation)
+    
+    # Save figure according to options
+    if save_fig is not None:
+        with profile_stage('savefig', category='plot', save_fig=save_fig):
+            fig.savefig(save_fig,bbox_inches='tight')
+        if cache_key is not None:
+            render_cache.store(cache_key,save_fig)
+    
+    # Show figure according to options
+    if show_fig == True:
+        plt.show()
+    
+    # Close figure according to options
+    if close_fig == True:
+        plt.close(fig)
+
+
+
+PLOT_FUNCTIONS = {'line': create_line_plot, 'scatter': create_scatter_plot, 'box': create_box_plot}
+
+
+
+'''
+    This function will render the given plot specs one after another on a single reused figure.
+    The figure is a plain matplotlib Figure drawn by the Agg canvas, it is never registered with pyplot so
+    no GUI backend is involved and nothing is left open once the specs are rendered.
+    Returns list of save_fig values of the specs
+'''
+def _render_specs(plot_specs):
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+
+    saved_figs = []
+    for plot_spec in plot_specs:
+        opts = dict(plot_spec['opts'])
+        plot_type = plot_spec['plot_type']
+        xdata = plot_spec.get('xdata', None)
+        save_fig = opts.get('save_fig', None)
+        saved_figs.append(save_fig)
+
+        plot_function = PLOT_FUNCTIONS[plot_type]
+        if plot_type == 'box':
+            args = (plot_spec['ydata'], opts)
+            details = _describe_box_plot(*args)
+        else:
+            args = (xdata, plot_spec['ydata'], opts)
+            details = _describe_plot(*args)
+
+        # The figure is reused, so the render cache is looked up here rather than by the plotting function.
+        # Lookup and rendering are recorded as one span of the plotting function, whose undecorated version is called
+        render_cache = opts.pop('render_cache', None)
+        with profile_stage(plot_function.__name__, 'plot', **details) as details:
+            cache_key = None
+            if render_cache is not None and save_fig is not None:
+                cache_key = render_cache.key(plot_type, xdata, plot_spec['ydata'], opts)
+                if render_cache.fetch(cache_key, save_fig):
+                    details['cache_hit'] = True
+                    continue
+
+            fig.clf()
+            ax = fig.add_subplot()
+
+            opts['reuse_last_fig'] = (fig, ax)
+            opts['show_fig'] = False
+            opts['close_fig'] = False
+
+            plot_function.__wrapped__(*args)
+
+            if cache_key is not None:
+                render_cache.store(cache_key, save_fig)
+
+    return saved_figs
+
+
+
+'''
+    This function will render many plots headlessly, e.g. every year x pollutant x plot type of a report.
+    plot_specs : List of dicts, each having
+        - plot_type : 'line'/'scatter'/'box'
+        - xdata : X coordinates of data points (not needed for 'box')
+        - ydata : Y coordinates of data points / collection(s) of data points for 'box'
+        - opts : Options as accepted by create_line_plot/create_scatter_plot/create_box_plot, save_fig
+                 should be given as figures are never shown (reuse_last_fig/show_fig/close_fig are ignored).
+                 If render_cache is given, figures found in it are copied to save_fig instead of being rendered
+    max_workers : Number of processes rendering in parallel, 1 renders in this process (1 by default)
+    batch_size : Number of specs sent to a process at a time, each process reuses one figure per batch
+                 (By Default specs are split in about 4 batches per process)
+    Returns list of save_fig values, in the order of plot_specs
+'''
+def render_batch(plot_specs, max_workers=1, batch_size=None):
+
+    if max_workers is None or max_workers < 1:
+        raise ValueError("max_workers should be a positive integer, got "+str(max_workers))
+
+    for plot_spec in plot_specs:
+        if plot_spec.get('plot_type') not in PLOT_FUNCTIONS:
+            raise ValueError("plot_type should be one of "+str(list(PLOT_FUNCTIONS))+", got "+str(plot_spec.get('plot_type')))
+
+    if max_workers == 1 or len(plot_specs) <= 1:
+        return _render_specs(plot_specs)
+
+    if batch_size is None:
+        batch_size = max(1, -(-len(plot_specs) // (4*max_workers)))
+    batches = [plot_specs[i:i+batch_size] for i in range(0, len(plot_specs), batch_size)]
+
+    # executor.map keeps the order of batches, so results line up with plot_specs
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        saved_batches = list(executor.map(_render_specs, batches))
+
+    return [save_fig for saved_figs in saved_batches for save_fig in saved_figs]
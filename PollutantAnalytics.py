@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we compute rolling means, exceedances of the national standards and AQI style sub-indices
+    of the daily air quality readings of Delhi (see AirQualityData.py).
+    Readings are first reduced to one value per (station, day). Every computation is then done on whole
+    columns at once : rolling windows of all stations are taken in a single pass over cumulative sums of the
+    rows sorted by (station, date), instead of looping over stations and days.
+    Results keep the station column of the unified schema, so they can be given to station_box_plot_data
+    (box plots per station) or sliced per station for create_line_plot.
+'''
+
+
+
+import numpy as np
+import pandas as pd
+
+from AirQualityData import STATION_COLUMN, UNKNOWN_STATION, reading_values
+
+
+
+ANALYTICS_POLLUTANTS = ['SO2', 'NO2', 'RSPM/PM10', 'PM 2.5']
+
+# Length in days of the rolling windows, readings being daily the 24 hour window is the daily mean itself
+ROLLING_WINDOWS = {'24h': 1, '7d': 7, '30d': 30}
+
+# 24 hourly limits (microgm/m3) of the National Ambient Air Quality Standards, 2009
+STANDARD_LIMITS = {'SO2': 80.0, 'NO2': 80.0, 'RSPM/PM10': 100.0, 'PM 2.5': 60.0}
+
+# Breakpoints of the CPCB National Air Quality Index for 24 hourly averages : concentrations (microgm/m3)
+# at which the sub-index reaches 0, 50 (Good), 100 (Satisfactory), 200 (Moderate), 300 (Poor), 400 (Very Poor)
+AQI_LEVELS = [0, 50, 100, 200, 300, 400]
+AQI_BREAKPOINTS = {'SO2': [0, 40, 80, 380, 800, 1600],
+                   'NO2': [0, 40, 80, 180, 280, 400],
+                   'RSPM/PM10': [0, 50, 100, 250, 350, 430],
+                   'PM 2.5': [0, 30, 60, 90, 120, 250]}
+# Beyond the last breakpoint (Severe) the last segment is extended, the sub-index being capped here
+AQI_MAX = 500
+
+
+
+'''
+    This function will reduce the daily readings of data to one mean value per (station, day).
+    data : DataFrame having the unified schema (plain or compact)
+    pollutants : List of pollutant columns to keep, By Default ANALYTICS_POLLUTANTS
+    Returns DataFrame having columns [STATION_COLUMN, 'date', 'year'] + pollutants, sorted by (station, date).
+    Monthly/annual aggregates are left out. Daily rows without a station (1987, 1988 and 2003) are averaged
+    under AirQualityData.UNKNOWN_STATION, giving a Delhi wide daily mean.
+'''
+def daily_station_means(data, pollutants=ANALYTICS_POLLUTANTS):
+
+    daily = data[(data['granularity'] == 'daily') & data['date'].notna()]
+    pollutants = [pollutant for pollutant in pollutants if pollutant in daily.columns]
+
+    stations = daily[STATION_COLUMN].astype(object).where(daily[STATION_COLUMN].notna(), UNKNOWN_STATION)
+    # Float32 readings of compact data are widened to the csv values, so means do not depend on the representation
+    readings = pd.DataFrame({pollutant: reading_values(daily[pollutant]) for pollutant in pollutants}, index=daily.index)
+    readings.insert(0, STATION_COLUMN, stations)
+    readings.insert(1, 'date', daily['date'].dt.normalize())
+
+    means = readings.groupby([STATION_COLUMN, 'date'], sort=True).mean().reset_index()
+    means.insert(2, 'year', means['date'].dt.year.astype('int64'))
+
+    return means
+
+
+
+'''
+    This function will compute the trailing rolling means of the readings of every station in one pass.
+    A window of n days ending on a day covers the readings of that station from n-1 days before up to that day
+    (days without readings are simply missing, not counted as zeros).
+    daily : Result of daily_station_means
+    windows : dict of window name -> length in days, By Default ROLLING_WINDOWS
+    pollutants : List of pollutant columns, By Default those of ANALYTICS_POLLUTANTS present in daily
+    min_periods : Minimum number of readings in a window for its mean to be given, NaN otherwise (1 by default)
+    Returns copy of daily having one more column per (pollutant, window) named e.g. 'NO2 7d'
+'''
+def rolling_means(daily, windows=ROLLING_WINDOWS, pollutants=None, min_periods=1):
+
+    if pollutants is None:
+        pollutants = [pollutant for pollutant in ANALYTICS_POLLUTANTS if pollutant in daily.columns]
+    for name, days in windows.items():
+        if days < 1:
+            raise ValueError("Length of window "+str(name)+" should be at least 1 day, got "+str(days))
+
+    daily = daily.sort_values([STATION_COLUMN, 'date'], kind='stable', ignore_index=True)
+
+    # Days are numbered per station and stations are spaced farther apart than any window,
+    # so that a window never reaches into the previous station
+    station_codes = pd.factorize(daily[STATION_COLUMN], sort=True)[0].astype('int64')
+    day_numbers = daily['date'].to_numpy(dtype='datetime64[D]').astype('int64')
+    day_numbers = day_numbers - day_numbers.min() if len(day_numbers) > 0 else day_numbers
+    max_window = max(windows.values())
+    keys = station_codes * (int(day_numbers.max(initial=0)) + 2*max_window) + day_numbers
+
+    readings = daily[pollutants].to_numpy(dtype='float64', na_value=np.nan)
+    is_valid = ~np.isnan(readings)
+    # Cumulative sums having a leading row of zeros, the sum of rows i to j-1 being cumsum[j] - cumsum[i]
+    sums = np.vstack([np.zeros((1, len(pollutants))), np.cumsum(np.where(is_valid, readings, 0.0), axis=0)])
+    counts = np.vstack([np.zeros((1, len(pollutants)), dtype='int64'), np.cumsum(is_valid, axis=0)])
+
+    stops = np.arange(1, len(daily)+1)
+    for name, days in windows.items():
+        starts = np.searchsorted(keys, keys - (days - 1), side='left')
+        window_counts = counts[stops] - counts[starts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            window_means = (sums[stops] - sums[starts]) / window_counts
+        window_means[window_counts < max(min_periods, 1)] = np.nan
+        for position, pollutant in enumerate(pollutants):
+            daily[pollutant+' '+name] = window_means[:, position]
+
+    return daily
+
+
+
+'''
+    This function will count the days on which the national standards (24 hourly limits) were exceeded.
+    daily : Result of daily_station_means (or rolling_means)
+    by : Columns to group by, By Default [STATION_COLUMN, 'year']. Counts are station-days, so grouping by
+         'year' alone gives the number of station-days above the limit across Delhi
+    limits : dict of pollutant -> limit in microgm/m3, By Default STANDARD_LIMITS
+    Returns DataFrame indexed by the by columns, having per pollutant the days exceeding its limit
+    (column named after the pollutant) and the days having a reading (column pollutant+' days')
+'''
+def exceedance_counts(daily, by=[STATION_COLUMN, 'year'], limits=STANDARD_LIMITS):
+
+    limits = {pollutant: limit for pollutant, limit in limits.items() if pollutant in daily.columns}
+
+    flags = pd.DataFrame(index=daily.index)
+    for pollutant, limit in limits.items():
+        readings = daily[pollutant].to_numpy(dtype='float64', na_value=np.nan)
+        flags[pollutant] = (readings > limit).astype('int64')
+        flags[pollutant+' days'] = (~np.isnan(readings)).astype('int64')
+
+    keys = [daily[column] for column in ([by] if isinstance(by, str) else by)]
+
+    return flags.groupby(keys, sort=True).sum()
+
+
+
+'''
+    This function will compute the AQI sub-index of a pollutant, interpolating linearly between the
+    breakpoints of AQI_BREAKPOINTS.
+    readings : Array/Series of 24 hourly mean concentrations (microgm/m3), NaN for missing readings
+    pollutant : One of the pollutants of AQI_BREAKPOINTS e.g. 'PM 2.5'
+    Returns numpy array of sub-indices between 0 and AQI_MAX, NaN where the reading is missing
+'''
+def sub_index(readings, pollutant):
+
+    if pollutant not in AQI_BREAKPOINTS:
+        raise ValueError("No AQI breakpoints for pollutant "+str(pollutant)+", expected one of "+str(list(AQI_BREAKPOINTS)))
+
+    readings = np.asarray(readings, dtype='float64')
+    breakpoints = np.asarray(AQI_BREAKPOINTS[pollutant], dtype='float64')
+    levels = np.asarray(AQI_LEVELS, dtype='float64')
+
+    indices = np.interp(np.clip(readings, 0.0, None), breakpoints, levels)
+
+    # np.interp stays at the last level beyond the last breakpoint, the last segment is extended instead
+    slope = (levels[-1] - levels[-2]) / (breakpoints[-1] - breakpoints[-2])
+    beyond = readings > breakpoints[-1]
+    indices[beyond] = levels[-1] + (readings[beyond] - breakpoints[-1]) * slope
+
+    return np.minimum(indices, AQI_MAX)
+
+
+
+'''
+    This function will compute the AQI style sub-index of every pollutant and the overall index, i.e. the
+    largest sub-index of a day. Unlike the official AQI no minimum number of pollutants is required, a day
+    having a single reading gets that sub-index as its index.
+    daily : Result of daily_station_means (daily means being the 24 hourly averages the breakpoints are for)
+    pollutants : List of pollutant columns, By Default those of AQI_BREAKPOINTS present in daily
+    Returns copy of daily having one more column per pollutant named e.g. 'NO2 sub-index', and 'AQI'
+'''
+def aqi_sub_indices(daily, pollutants=None):
+
+    if pollutants is None:
+        pollutants = [pollutant for pollutant in AQI_BREAKPOINTS if pollutant in daily.columns]
+
+    daily = daily.copy()
+    for pollutant in pollutants:
+        daily[pollutant+' sub-index'] = sub_index(daily[pollutant].to_numpy(dtype='float64', na_value=np.nan), pollutant)
+
+    # Largest sub-index of the day, days without any reading having no index
+    daily['AQI'] = daily[[pollutant+' sub-index' for pollutant in pollutants]].max(axis=1, skipna=True)
+
+    return daily
+
+
+
+'''
+    This function will give a column of a station between two dates, ready to be given as xdata, ydata
+    to create_line_plot e.g. station_series(rolling_means(daily), 'ITO, New Delhi', 'PM 2.5 30d').
+    start, end : First and last dates (inclusive), None for no bound (None by default)
+    Returns (dates, values) as Series, days where the value is missing being left out
+'''
+def station_series(analytics, station, column, start=None, end=None):
+
+    rows = analytics[analytics[STATION_COLUMN] == station]
+    if start is not None:
+        rows = rows[rows['date'] >= pd.Timestamp(start)]
+    if end is not None:
+        rows = rows[rows['date'] <= pd.Timestamp(end)]
+    rows = rows[['date', column]].dropna()
+
+    return rows['date'], rows[column]
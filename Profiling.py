@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we keep an opt-in instrumentation layer for the plotting pipeline.
+    When enabled, every instrumented stage (analysis sections of GeneratingPlots.py, reading of a yearly file,
+    calls to create_line_plot/create_scatter_plot/create_box_plot and their savefig) is recorded as a span
+    having its wall time and details like year, pollutant and rows processed.
+    Spans are exported as a trace file in the Chrome trace event format (open it in chrome://tracing,
+    https://ui.perfetto.dev or speedscope) and/or as structured logs, one JSON object per line.
+    When disabled (the default) instrumentation costs a function call per stage.
+
+    Profiling is enabled either by calling enable_profiling() or by setting environment variables before a run :
+        AQ_PROFILE_TRACE=<trace file path>   AQ_PROFILE_LOG=<log file path>
+    Spans of worker processes (e.g. render_batch/load_years with max_workers > 1) are not recorded, neither in the
+    trace nor in the log, forked workers inherit the state of this module but only the process which enabled
+    profiling records.
+'''
+
+
+
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import multiprocessing
+from contextlib import contextmanager
+
+
+
+_events = None
+_log_file = None
+_trace_path = None
+# Process which enabled profiling, the only one recording spans
+_owner_pid = None
+_origin = time.perf_counter()
+
+# Spans of profile_stage blocks and profiled calls being run, per thread, innermost last
+_open_spans = threading.local()
+
+
+
+'''
+    This function will start recording spans.
+    trace_path : File in which the trace is written by write_trace/at exit, None for no trace (None by default)
+    log_path : File to which one JSON line per span is appended as soon as it ends, None for no log (None by default)
+'''
+def enable_profiling(trace_path=None, log_path=None):
+
+    global _events, _log_file, _trace_path, _owner_pid
+
+    disable_profiling()
+
+    _events = []
+    _owner_pid = os.getpid()
+    _trace_path = trace_path
+    if log_path is not None:
+        _log_file = open(log_path, 'a')
+
+
+'''
+    This function will stop recording spans, writing the trace file if one was asked for.
+'''
+def disable_profiling():
+
+    global _events, _log_file, _trace_path
+
+    if _events is not None and _trace_path is not None:
+        write_trace(_trace_path)
+    if _log_file is not None:
+        _log_file.close()
+
+    _events = None
+    _log_file = None
+    _trace_path = None
+
+
+def is_profiling():
+
+    return _events is not None and os.getpid() == _owner_pid
+
+
+
+'''
+    This function will start a span.
+    name : Name of the stage e.g. 'create_box_plot'
+    category : Category of the stage e.g. 'section'/'plot'/'io' ('stage' by default)
+    args : Details of the stage e.g. year=2015, pollutant='NO2'
+    Returns the span to be given to end_stage, None if profiling is disabled
+'''
+def start_stage(name, category='stage', **args):
+
+    if not is_profiling():
+        return None
+
+    return {'name': name, 'cat': category, 'start': time.perf_counter(), 'args': args}
+
+
+'''
+    This function will end a span started by start_stage, with more details known only at the end e.g. rows.
+'''
+def end_stage(span, **args):
+
+    if span is None or not is_profiling():
+        return
+
+    end = time.perf_counter()
+    span['args'].update(args)
+
+    event = {'name': span['name'], 'cat': span['cat'], 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+             'ts': (span['start'] - _origin) * 1e6, 'dur': (end - span['start']) * 1e6,
+             'args': {key: _jsonable(value) for key, value in span['args'].items()}}
+    _events.append(event)
+
+    if _log_file is not None:
+        _log_file.write(json.dumps({'stage': event['name'], 'category': event['cat'], 'seconds': end - span['start'],
+                                    **event['args']}) + '\n')
+        _log_file.flush()
+
+
+'''
+    This function will add details to the innermost span being run by profile_stage/profiled, e.g. a plotting
+    function marking that its figure came from the render cache. Nothing is done if profiling is disabled.
+'''
+def annotate_stage(**args):
+
+    spans = getattr(_open_spans, 'spans', None)
+    if not is_profiling() or not spans or spans[-1] is None:
+        return
+
+    spans[-1]['args'].update(args)
+
+
+def _push_span(span):
+
+    if not hasattr(_open_spans, 'spans'):
+        _open_spans.spans = []
+    _open_spans.spans.append(span)
+
+
+def _pop_span():
+
+    _open_spans.spans.pop()
+
+
+
+'''
+    This function will record the enclosed block as a span, e.g.
+        with profile_stage('load', category='io') as details:
+            data = ...
+            details['rows'] = len(data)
+    If the block raises, the span is recorded all the same with the exception as its 'error' detail.
+'''
+@contextmanager
+def profile_stage(name, category='stage', **args):
+
+    span = start_stage(name, category, **args)
+    details = {}
+    _push_span(span)
+    try:
+        yield details
+    except BaseException as error:
+        details['error'] = repr(error)
+        raise
+    finally:
+        _pop_span()
+        end_stage(span, **details)
+
+
+
+'''
+    This function will make a decorator recording every call of a function as a span.
+    name : Name of the span, name of the function if None (None by default)
+    category : Category of the span ('call' by default)
+    describe : Function taking the arguments of the call and returning a dict of details (None by default)
+    If the function returns something having a shape (e.g. a DataFrame), its number of rows is recorded too.
+    If the function raises, the span is recorded all the same with the exception as its 'error' detail.
+'''
+def profiled(name=None, category='call', describe=None):
+
+    def decorator(function):
+
+        span_name = name if name is not None else function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not is_profiling():
+                return function(*args, **kwargs)
+
+            span = start_stage(span_name, category, **(describe(*args, **kwargs) if describe is not None else {}))
+            details = {}
+            _push_span(span)
+            try:
+                result = function(*args, **kwargs)
+                if hasattr(result, 'shape'):
+                    details['rows'] = result.shape[0]
+                return result
+            except BaseException as error:
+                details['error'] = repr(error)
+                raise
+            finally:
+                _pop_span()
+                end_stage(span, **details)
+
+        return wrapper
+
+    return decorator
+
+
+
+'''
+    This function will write the spans recorded so far as a Chrome trace event file.
+'''
+def write_trace(trace_path):
+
+    if _events is None:
+        return
+
+    with open(trace_path, 'w') as trace_file:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+
+def _jsonable(value):
+
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, 'item') and getattr(value, 'size', 1) == 1:
+        return value.item()
+
+    return str(value)
+
+
+
+# Worker processes import this module too, only the main process records so that it alone writes the trace
+if (os.environ.get('AQ_PROFILE_TRACE') or os.environ.get('AQ_PROFILE_LOG')) and multiprocessing.parent_process() is None:
+    enable_profiling(os.environ.get('AQ_PROFILE_TRACE') or None, os.environ.get('AQ_PROFILE_LOG') or None)
+    atexit.register(disable_profiling)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we keep a content addressed cache of rendered figures.
+    A figure is identified by the hash of its plot type, its input data and its options, so a figure whose
+    inputs did not change is copied from the cache to save_fig instead of being rendered again.
+    The cache is bounded in size, the least recently used figures are evicted first.
+'''
+
+
+
+import os
+import shutil
+import hashlib
+from stat import S_ISREG
+import numpy as np
+import matplotlib
+from pathlib import Path
+
+from AirQualityData import CACHE_DIR
+
+
+
+RENDER_CACHE_DIR = Path(CACHE_DIR) / 'renders'
+
+# Bump this whenever the plotting functions change the way figures look, so that old renders are not reused
+RENDER_CACHE_VERSION = 1
+
+# Options which do not change the rendered image (save_fig only matters through its extension)
+IGNORED_OPTIONS = ['save_fig', 'show_fig', 'reuse_last_fig', 'close_fig', 'render_cache']
+
+
+
+def _update_digest(digest, data):
+
+    if isinstance(data, dict):
+        digest.update(b'{')
+        for key in sorted(data, key=str):
+            digest.update(repr(key).encode())
+            _update_digest(digest, data[key])
+        digest.update(b'}')
+        return
+
+    if isinstance(data, (list, tuple)):
+        try:
+            values = np.asarray(data)
+        except ValueError:
+            # Collections of different lengths (e.g. box plot data) are hashed item by item
+            values = None
+        if values is None or values.dtype.kind == 'O':
+            digest.update(('['+str(len(data))).encode())
+            for item in data:
+                _update_digest(digest, item)
+            digest.update(b']')
+            return
+
+    values = np.asarray(data)
+    digest.update((str(values.dtype)+str(values.shape)).encode())
+    if values.dtype.kind == 'O':
+        digest.update(repr(values.tolist()).encode())
+    else:
+        digest.update(np.ascontiguousarray(values).tobytes())
+
+
+
+class RenderCache:
+
+    '''
+        cache_dir : Directory in which rendered figures are kept
+        max_bytes : Maximum total size of the kept figures, By Default 256 MB
+    '''
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=256*1024*1024):
+
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+
+    '''
+        This function will compute the key of a figure.
+        plot_type : 'line'/'scatter'/'box'
+        xdata, ydata : Data given to the plotting function (xdata is None for box plots)
+        opts : Options given to the plotting function
+    '''
+    def key(self, plot_type, xdata, ydata, opts):
+
+        digest = hashlib.sha256(('v'+str(RENDER_CACHE_VERSION)+'-'+matplotlib.__version__+'-'+plot_type).encode())
+        _update_digest(digest, xdata)
+        _update_digest(digest, ydata)
+        _update_digest(digest, {name: value for name, value in opts.items() if name not in IGNORED_OPTIONS})
+
+        # The same figure saved in another format is another file
+        digest.update(Path(str(opts.get('save_fig', ''))).suffix.lower().encode())
+
+        return digest.hexdigest()
+
+
+    def _path(self, key, save_fig):
+
+        return self.cache_dir / (key+Path(str(save_fig)).suffix.lower())
+
+
+    '''
+        This function will copy the cached figure of key to save_fig, if there is one.
+        Returns True on a cache hit, False otherwise
+    '''
+    def fetch(self, key, save_fig):
+
+        cached_path = self._path(key, save_fig)
+
+        # Other processes sharing the cache (e.g. render_batch workers) may evict the figure at any time,
+        # a figure which disappears before being copied is a cache miss
+        try:
+            shutil.copyfile(cached_path, save_fig)
+            # Access time is tracked through the modification time, which is what eviction looks at
+            os.utime(cached_path)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+
+    '''
+        This function will keep a copy of the freshly rendered save_fig under key, evicting the least recently
+        used figures if the cache grows beyond max_bytes.
+    '''
+    def store(self, key, save_fig):
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        cached_path = self._path(key, save_fig)
+        # Temporary name is per process, as workers may store the same figure at the same time
+        tmp_path = cached_path.with_name(cached_path.name+'.'+str(os.getpid())+'.tmp')
+        shutil.copyfile(save_fig, tmp_path)
+        tmp_path.replace(cached_path)
+
+        self.evict()
+
+
+    '''
+        This function will delete the least recently used figures until the cache fits in max_bytes.
+    '''
+    def evict(self):
+
+        if not self.cache_dir.is_dir():
+            return
+
+        entries = []
+        for cached_path in self.cache_dir.iterdir():
+            if cached_path.name.endswith('.tmp'):
+                continue
+            # Figures evicted meanwhile by another process sharing the cache are skipped
+            try:
+                stat = cached_path.stat()
+            except FileNotFoundError:
+                continue
+            if S_ISREG(stat.st_mode):
+                entries.append((stat.st_mtime, stat.st_size, cached_path))
+
+        total_bytes = sum(size for mtime, size, cached_path in entries)
+        for mtime, size, cached_path in sorted(entries, key=lambda entry: entry[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            cached_path.unlink(missing_ok=True)
+            total_bytes -= size
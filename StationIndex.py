@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+    In this code we keep an index over the unified air quality data of Delhi (see AirQualityData.py) for
+    quick slice lookups like "NO2 at one station from Jan 2010 to Mar 2014".
+    Rows are stored sorted by (station, date), so the rows of a station are contiguous and, inside them,
+    the rows of a date range are contiguous too. Offset tables per station and per (station, year) locate
+    these blocks, and a query only converts the rows of its block from the (memory mapped) stored table.
+'''
+
+
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+import AirQualityData
+from AirQualityData import (DATA_DIR, CACHE_DIR, COLUMNAR_SUFFIX, STATION_COLUMN, UNKNOWN_STATION, list_year_files, corpus_hash,
+                            load_cpcb_data, write_columnar, read_columnar)
+
+
+
+# NaT sorts last inside a station, so it is searched as the largest possible date
+NAT_SEARCH_VALUE = np.iinfo('int64').max
+
+
+
+class StationIndex:
+
+    '''
+        table : Rows sorted by (station, date), either a pyarrow Table or a DataFrame
+        stations : Station of every row of table, as a numpy array
+        dates : Date of every row of table as int64 nanoseconds (NAT_SEARCH_VALUE for NaT)
+    '''
+    def __init__(self, table, stations, dates):
+
+        self.table = table
+        self.dates = dates
+
+        # Offset table per station : station -> (first row, last row + 1)
+        boundaries = np.flatnonzero(stations[1:] != stations[:-1]) + 1
+        starts = np.concatenate([[0], boundaries]) if len(stations) > 0 else np.array([], dtype='int64')
+        stops = np.concatenate([boundaries, [len(stations)]]) if len(stations) > 0 else np.array([], dtype='int64')
+        self.station_offsets = {stations[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+        # Offset table per (station, year), years being contiguous as dates are sorted inside a station.
+        # Blocks start wherever the station or the year changes, rows without a date are left out
+        date_values = dates.view('datetime64[ns]').copy()
+        date_values[dates == NAT_SEARCH_VALUE] = np.datetime64('NaT')
+        years = np.asarray(pd.DatetimeIndex(date_values).year, dtype='float64')
+        changes = (stations[1:] != stations[:-1]) | (years[1:] != years[:-1])
+        block_starts = np.flatnonzero(np.concatenate([[len(stations) > 0], changes]))
+        block_stops = np.append(block_starts[1:], len(stations)).astype('int64')
+        is_dated = ~np.isnan(years[block_starts])
+        self.year_offsets = {(stations[start], int(years[start])): (int(start), int(stop))
+                             for start, stop in zip(block_starts[is_dated], block_stops[is_dated])}
+
+
+    '''
+        This function will list the stations of the index, optionally only those whose name contains pattern
+        (case insensitive) e.g. stations('ITO').
+    '''
+    def stations(self, pattern=None):
+
+        stations = list(self.station_offsets)
+        if pattern is not None:
+            stations = [station for station in stations if pattern.lower() in str(station).lower()]
+
+        return stations
+
+
+    '''
+        This function will give the row range of a station between two dates.
+        station : Name of the station, as listed by stations()
+        start, end : First and last dates (inclusive) of the range, None for no bound (None by default)
+        year : Only rows of this year (along with start/end if given), None for all years (None by default)
+        Returns (first row, last row + 1), an empty range if the station (or its year) is not indexed
+    '''
+    def row_range(self, station, start=None, end=None, year=None):
+
+        # Dates are searched only inside the block of the station, or of the year if one is given
+        if year is None:
+            block = self.station_offsets.get(station)
+        else:
+            block = self.year_offsets.get((station, int(year)))
+        if block is None:
+            return (0, 0)
+
+        block_first, block_last = block
+        block_dates = self.dates[block_first:block_last]
+        first, last = block
+
+        if start is not None:
+            first = block_first + int(np.searchsorted(block_dates, pd.Timestamp(start).value, side='left'))
+        if end is not None:
+            last = block_first + int(np.searchsorted(block_dates, pd.Timestamp(end).value, side='right'))
+        elif start is not None:
+            # Rows without a date are last in the block, and are never after start
+            last = block_first + int(np.searchsorted(block_dates, NAT_SEARCH_VALUE, side='left'))
+
+        return (first, max(first, last))
+
+
+    '''
+        This function will give the rows of a station between two dates, reading only those rows.
+        station : Name of the station, as listed by stations()
+        start, end : First and last dates (inclusive) of the range, None for no bound (None by default)
+        columns : List of columns to read, all columns if None (None by default)
+        year : Only rows of this year, None for all years (None by default)
+        Returns DataFrame sorted by date
+    '''
+    def query(self, station, start=None, end=None, columns=None, year=None):
+
+        first, last = self.row_range(station, start, end, year)
+
+        if isinstance(self.table, pd.DataFrame):
+            rows = self.table.iloc[first:last]
+            if columns is not None:
+                rows = rows[columns]
+            return rows.reset_index(drop=True)
+
+        table = self.table.slice(first, last - first)
+        if columns is not None:
+            table = table.select(columns)
+
+        return table.to_pandas().reset_index(drop=True)
+
+
+    '''
+        This function will give the readings of a pollutant at a station between two dates, ready to be given
+        as xdata, ydata to create_line_plot/create_scatter_plot. Missing readings are left out.
+        Returns (dates, readings) as Series
+    '''
+    def query_series(self, station, pollutant, start=None, end=None, year=None):
+
+        rows = self.query(station, start, end, columns=['date', pollutant], year=year).dropna()
+
+        return rows['date'], rows[pollutant]
+
+
+    '''
+        This function will give the readings of a pollutant per station between two dates, ready to be given
+        to create_box_plot as ydata with opts['xtick_labels'] = station_labels.
+        stations : List of stations, all the indexed stations if None (None by default)
+        year : Only readings of this year, None for all years (None by default)
+        Returns (box_plot_data, station_labels), stations having no reading being left out
+    '''
+    def query_box_plot_data(self, pollutant, start=None, end=None, stations=None, year=None):
+
+        if stations is None:
+            stations = self.stations()
+
+        box_plot_data = []
+        station_labels = []
+        for station in stations:
+            dates, readings = self.query_series(station, pollutant, start, end, year)
+            if len(readings) > 0:
+                box_plot_data.append(readings.to_numpy())
+                station_labels.append(station)
+
+        return box_plot_data, station_labels
+
+
+
+'''
+    This function will sort data by (station, date) as stored by the index.
+    Rows without a station are kept under AirQualityData.UNKNOWN_STATION.
+'''
+def sort_for_index(data):
+
+    data = data.copy()
+    stations = data[STATION_COLUMN]
+    if isinstance(stations.dtype, pd.CategoricalDtype) and UNKNOWN_STATION not in stations.cat.categories:
+        # Compact frames (see AirQualityData.compact_data) keep stations as categories
+        stations = stations.cat.add_categories([UNKNOWN_STATION])
+    data[STATION_COLUMN] = stations.fillna(UNKNOWN_STATION)
+
+    return data.sort_values([STATION_COLUMN, 'date'], kind='stable', na_position='last', ignore_index=True)
+
+
+
+def _search_dates(dates):
+
+    dates = pd.Series(dates).astype('datetime64[ns]')
+
+    return np.where(dates.isna(), NAT_SEARCH_VALUE, dates.to_numpy().view('int64'))
+
+
+
+'''
+    This function will build an in memory index over data (e.g. a filtered or synthetic unified frame).
+'''
+def build_station_index(data):
+
+    sorted_data = sort_for_index(data)
+
+    return StationIndex(sorted_data, sorted_data[STATION_COLUMN].to_numpy(dtype=object), _search_dates(sorted_data['date']))
+
+
+
+'''
+    This function will open the persistent index of the csv files of data_dir, building and storing it first
+    if the files changed since it was built. With pyarrow the stored table is memory mapped, so queries only
+    read the rows they return.
+    data_dir : Directory containing cpcb_dly_aq_delhi-<year>.csv files
+    cache_dir : Directory where the index is stored
+    Returns StationIndex
+'''
+def load_station_index(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+
+    index_path = Path(cache_dir) / ('station_index-'+corpus_hash(list_year_files(data_dir))+COLUMNAR_SUFFIX)
+
+    if not index_path.is_file():
+        write_columnar(sort_for_index(load_cpcb_data(data_dir, cache_dir)), index_path)
+
+        # Removing indexes of older versions of the corpus
+        for old_path in index_path.parent.glob('station_index-*'):
+            if old_path != index_path:
+                old_path.unlink()
+
+    if AirQualityData.feather is None:
+        table = read_columnar(index_path)
+        return StationIndex(table, table[STATION_COLUMN].to_numpy(dtype=object), _search_dates(table['date']))
+
+    table = AirQualityData.feather.read_table(str(index_path), memory_map=True)
+    stations = table.column(STATION_COLUMN).to_numpy(zero_copy_only=False).astype(object)
+    dates = _search_dates(table.column('date').to_pandas())
+
+    return StationIndex(table, stations, dates)
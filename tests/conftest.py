@@ -0,0 +1,33 @@
+'''
+    Shared fixtures of the tests. The modules of this repository are plain scripts at its root, so the root
+    is put on sys.path, and plots are rendered with the Agg backend so that no window is opened.
+'''
+
+
+
+import sys
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('Agg')
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from AirQualityData import load_cpcb_data
+
+
+
+'''
+    Unified frame of the bundled csv files, parsed once per test session (with a cache of its own).
+'''
+@pytest.fixture(scope='session')
+def unified_data(tmp_path_factory):
+
+    return load_cpcb_data(cache_dir=tmp_path_factory.mktemp('cache'))
+
+
+@pytest.fixture(scope='session')
+def compact_unified_data(tmp_path_factory):
+
+    return load_cpcb_data(cache_dir=tmp_path_factory.mktemp('compact_cache'), compact=True)
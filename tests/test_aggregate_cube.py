@@ -0,0 +1,144 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import AggregateCube
+import AirQualityData
+from AirQualityData import POLLUTANT_COLUMNS, STATION_COLUMN, UNKNOWN_STATION, DATA_DIR, list_year_files, load_years, iter_chunks
+from AggregateCube import build_cube, rollup, refresh_cube, yearly_row_counts, sketch_quantiles, stream_rollup, add_quantiles
+
+
+
+@pytest.fixture(scope='module')
+def cube(unified_data):
+
+    return build_cube(unified_data)
+
+
+'''
+    Long frame of the readings, one row per (raw row, pollutant), as the cube aggregates them.
+'''
+@pytest.fixture(scope='module')
+def readings(unified_data):
+
+    stations = unified_data[STATION_COLUMN].astype(object).fillna(UNKNOWN_STATION)
+
+    return pd.concat([pd.DataFrame({'year': unified_data['year'], 'station': stations, 'pollutant': pollutant,
+                                    'value': unified_data[pollutant].astype('float64')})
+                      for pollutant in POLLUTANT_COLUMNS], ignore_index=True)
+
+
+
+@pytest.mark.parametrize('by', [['year', 'pollutant'], ['station', 'pollutant'], ['pollutant']])
+def test_rollup_matches_groupby(cube, readings, by):
+
+    rolled = rollup(cube, by).set_index(by)
+    expected = readings.groupby(by)['value'].agg(['size', 'count', 'sum', 'min', 'max', 'mean'])
+
+    np.testing.assert_array_equal(rolled['rows'].to_numpy(), expected['size'].to_numpy())
+    np.testing.assert_array_equal(rolled['count'].to_numpy(), expected['count'].to_numpy())
+    np.testing.assert_allclose(rolled['sum'].to_numpy(), expected['sum'].to_numpy())
+    np.testing.assert_array_equal(rolled['min'].to_numpy(), expected['min'].to_numpy())
+    np.testing.assert_array_equal(rolled['max'].to_numpy(), expected['max'].to_numpy())
+    np.testing.assert_allclose(rolled['mean'].to_numpy(), expected['mean'].to_numpy())
+    np.testing.assert_array_equal([sketch.sum() for sketch in rolled['sketch']], expected['count'].to_numpy())
+
+
+def test_sketch_quantiles_close_to_exact_quantiles(cube, readings):
+
+    rolled = rollup(cube, ['pollutant']).set_index('pollutant')
+
+    for pollutant in POLLUTANT_COLUMNS:
+        values = readings.loc[readings['pollutant'] == pollutant, 'value'].dropna()
+        cell = rolled.loc[pollutant]
+        estimates = sketch_quantiles(cell['sketch'], [0.25, 0.5, 0.75], cell['min'], cell['max'])
+        # Bins are about 7.5% wide, estimates are expected within one bin of the exact quantiles
+        np.testing.assert_allclose(estimates, values.quantile([0.25, 0.5, 0.75]).to_numpy(), rtol=0.08)
+
+
+
+def test_refresh_cube_from_loaded_data_matches_csv(unified_data, tmp_path):
+
+    from_csv = refresh_cube(DATA_DIR, tmp_path / 'csv_cube.pkl')
+    from_data = refresh_cube(DATA_DIR, tmp_path / 'data_cube.pkl', data=unified_data)
+
+    pd.testing.assert_frame_equal(from_csv, from_data)
+    pd.testing.assert_series_equal(yearly_row_counts(from_csv), unified_data.groupby('year').size(), check_names=False)
+
+
+def test_refresh_cube_from_compact_data_matches_csv(compact_unified_data, tmp_path):
+
+    from_csv = refresh_cube(DATA_DIR, tmp_path / 'csv_cube.pkl')
+    from_data = refresh_cube(DATA_DIR, tmp_path / 'data_cube.pkl', data=compact_unified_data)
+
+    pd.testing.assert_frame_equal(from_csv, from_data)
+
+
+
+def test_refresh_cube_rebuilds_only_changed_and_removed_years(tmp_path, monkeypatch):
+
+    data_dir = tmp_path / 'csv'
+    data_dir.mkdir()
+    for year, file_path in list_year_files(DATA_DIR)[:3]:
+        shutil.copy(file_path, data_dir / file_path.name)
+    cube_path = tmp_path / 'cube.pkl'
+    refresh_cube(data_dir, cube_path)
+
+    (edited_year, edited_path), (removed_year, removed_path), (kept_year, kept_path) = list_year_files(data_dir)
+    lines = edited_path.read_text().splitlines(keepends=True)
+    edited_path.write_text(''.join(lines[:len(lines)//2]))
+    removed_path.unlink()
+
+    read_years = []
+    def recording_read_year_csv(file_path, year):
+        read_years.append(year)
+        return AirQualityData.read_year_csv(file_path, year)
+    monkeypatch.setattr(AggregateCube, 'read_year_csv', recording_read_year_csv)
+
+    refreshed = refresh_cube(data_dir, cube_path)
+
+    assert read_years == [edited_year]
+    expected = build_cube(load_years(list_year_files(data_dir)))
+    pd.testing.assert_frame_equal(refreshed.drop(columns='source_hash'), expected.drop(columns='source_hash'))
+    assert removed_year not in set(refreshed['year'])
+    assert refreshed.groupby('year')['source_hash'].first().to_dict() == {
+        edited_year: AirQualityData.file_hash(edited_path), kept_year: AirQualityData.file_hash(kept_path)}
+
+    # Nothing changed, nothing is read again, and a new SCHEMA_VERSION rebuilds every year
+    refresh_cube(data_dir, cube_path)
+    assert read_years == [edited_year]
+    monkeypatch.setattr(AirQualityData, 'SCHEMA_VERSION', AirQualityData.SCHEMA_VERSION + 1)
+    refresh_cube(data_dir, cube_path)
+    assert read_years == [edited_year, edited_year, kept_year]
+
+
+
+def test_chunks_never_span_two_files():
+
+    year_files = list_year_files(DATA_DIR)
+    chunk_years = []
+    for chunk in iter_chunks(DATA_DIR, chunksize=100, year_files=year_files):
+        assert 0 < len(chunk) <= 100
+        assert chunk['year'].nunique() == 1
+        chunk_years.append((chunk['year'].iloc[0], len(chunk)))
+
+    chunk_rows = pd.DataFrame(chunk_years, columns=['year', 'rows']).groupby('year', sort=False)['rows'].sum()
+    pd.testing.assert_series_equal(chunk_rows, load_years(year_files).groupby('year', sort=False).size(), check_names=False)
+
+
+def test_stream_rollup_matches_rollup_of_loaded_data():
+
+    streamed = stream_rollup(iter_chunks(DATA_DIR, chunksize=100))
+    expected = rollup(build_cube(load_years(list_year_files(DATA_DIR))), ['year', 'pollutant'])
+
+    # Sums are accumulated chunk by chunk, so only they may differ in the last bits
+    columns = ['year', 'pollutant', 'rows', 'count', 'min', 'max']
+    pd.testing.assert_frame_equal(streamed[columns], expected[columns])
+    np.testing.assert_allclose(streamed['sum'].to_numpy(), expected['sum'].to_numpy())
+    np.testing.assert_allclose(streamed['mean'].to_numpy(), expected['mean'].to_numpy())
+    for streamed_sketch, sketch in zip(streamed['sketch'], expected['sketch']):
+        np.testing.assert_array_equal(streamed_sketch, sketch)
+
+    pd.testing.assert_frame_equal(add_quantiles(streamed).filter(like='quantile_'), add_quantiles(expected).filter(like='quantile_'))
@@ -0,0 +1,151 @@
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import AirQualityData
+from AirQualityData import (DATA_DIR, POLLUTANT_COLUMNS, list_year_files, load_years, parse_sampling_dates, compact_data, reading_values, load_cpcb_data,
+                            partition_by_station, station_box_plot_data, STATION_COLUMN)
+
+
+
+def test_parse_sampling_dates_conventions():
+
+    parsed = parse_sampling_dates(['3/1/1987', '17-04-15', ' 17-04-15 ', 'January - M011990', 'Annual - M132002',
+                                   'March_1995', 'Annual_1995', 'not a date', None])
+
+    expected_dates = ['1987-01-03', '2015-04-17', '2015-04-17', '1990-01-01', '2002-01-01', '1995-03-01', '1995-01-01', None, None]
+    expected_granularity = ['daily', 'daily', 'daily', 'monthly', 'annual', 'monthly', 'annual', pd.NA, pd.NA]
+
+    pd.testing.assert_series_equal(parsed['date'], pd.Series(pd.to_datetime(expected_dates), dtype='datetime64[ns]'), check_names=False)
+    pd.testing.assert_series_equal(parsed['granularity'], pd.Series(expected_granularity, dtype='string'), check_names=False)
+
+
+def test_parse_sampling_dates_matches_strptime(unified_data):
+
+    date_strs = unified_data['Sampling Date'].dropna()
+    date_strs = date_strs[date_strs.str.match(r'^\d{2}-\d{2}-\d{2}$')]
+
+    expected = [np.datetime64(datetime.strptime(date_str, "%d-%m-%y"), 'ns') for date_str in date_strs]
+    np.testing.assert_array_equal(parse_sampling_dates(date_strs)['date'].to_numpy(), np.array(expected))
+
+
+
+
+'''
+    Copy of a few of the bundled csv files, covering the different headers of the corpus : no station (2003),
+    no station code (2005), quoted names (2014) and PM 2.5 in place of SPM (2014, 2015).
+'''
+@pytest.fixture
+def data_dir(tmp_path):
+
+    data_dir = tmp_path / 'csv'
+    data_dir.mkdir()
+    for year, file_path in list_year_files(DATA_DIR):
+        if year in (2003, 2005, 2014, 2015):
+            shutil.copy(file_path, data_dir / file_path.name)
+
+    return data_dir
+
+
+def test_unify_schema_maps_every_header_onto_the_same_columns(data_dir):
+
+    data = load_years(list_year_files(data_dir))
+    by_year = {year: data[data['year'] == year].reset_index(drop=True) for year in (2003, 2005, 2014, 2015)}
+
+    # Quoted headers of 2014 land on the same columns as unquoted ones
+    raw_2014 = pd.read_csv(data_dir / 'cpcb_dly_aq_delhi-2014.csv')
+    raw_2014.columns = [column.strip().strip('"') for column in raw_2014.columns]
+    assert raw_2014.columns[0] == 'Stn Code' and 'Location of Monitoring Station' in raw_2014.columns
+    for column in ['Stn Code', 'Sampling Date', STATION_COLUMN, 'NO2', 'PM 2.5']:
+        np.testing.assert_array_equal(by_year[2014][column].astype(object).fillna(-1).to_numpy(),
+                                      raw_2014[column].astype(object).fillna(-1).to_numpy())
+
+    # SPM and PM 2.5 are separate columns (PM 2.5 is reported, though empty, from 2014)
+    assert by_year[2003]['SPM'].notna().any() and by_year[2003]['PM 2.5'].isna().all()
+    assert by_year[2014]['SPM'].isna().all()
+    assert by_year[2015]['PM 2.5'].notna().any() and by_year[2015]['SPM'].isna().all()
+
+    # Columns missing from a year's file are NA for that year
+    assert by_year[2005]['Stn Code'].isna().all() and by_year[2005][STATION_COLUMN].notna().any()
+    assert by_year[2003][STATION_COLUMN].isna().all() and by_year[2003]['Stn Code'].notna().any()
+
+
+def test_second_load_is_served_from_the_columnar_cache(data_dir, tmp_path, monkeypatch):
+
+    cache_dir = tmp_path / 'cache'
+    expected = load_cpcb_data(data_dir, cache_dir)
+
+    def failing_load_years(year_files, max_workers=1):
+        raise AssertionError("csv files parsed again")
+    monkeypatch.setattr(AirQualityData, 'load_years', failing_load_years)
+
+    pd.testing.assert_frame_equal(load_cpcb_data(data_dir, cache_dir), expected)
+
+
+def test_edited_csv_gets_a_new_cache_file(data_dir, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+    load_cpcb_data(data_dir, cache_dir)
+    old_files = list(cache_dir.glob('cpcb_dly_aq_delhi-*'))
+    assert len(old_files) == 1
+
+    edited_path = data_dir / 'cpcb_dly_aq_delhi-2015.csv'
+    lines = edited_path.read_text().splitlines(keepends=True)
+    edited_path.write_text(''.join(lines[:len(lines)//2]))
+    data = load_cpcb_data(data_dir, cache_dir)
+
+    new_files = list(cache_dir.glob('cpcb_dly_aq_delhi-*'))
+    assert len(new_files) == 1 and new_files[0] != old_files[0]
+    assert AirQualityData.corpus_hash(list_year_files(data_dir)) in new_files[0].name
+    pd.testing.assert_frame_equal(data, load_years(list_year_files(data_dir)))
+
+
+def test_parallel_load_years_matches_serial():
+
+    year_files = list_year_files(DATA_DIR)
+    serial = load_years(year_files)
+
+    pd.testing.assert_frame_equal(load_years(year_files, max_workers=4), serial)
+    assert list(serial['year'].unique()) == [year for year, file_path in year_files]
+
+
+
+def test_compact_cache_round_trip(unified_data, tmp_path):
+
+    expected = compact_data(unified_data)
+
+    pd.testing.assert_frame_equal(load_cpcb_data(cache_dir=tmp_path, compact=True), expected)
+    # Second load is served by the compact cache file
+    pd.testing.assert_frame_equal(load_cpcb_data(cache_dir=tmp_path, compact=True), expected)
+
+
+def test_reading_values_of_compact_data_are_csv_values(unified_data, compact_unified_data):
+
+    for pollutant in POLLUTANT_COLUMNS:
+        np.testing.assert_array_equal(reading_values(compact_unified_data[pollutant]),
+                                      unified_data[pollutant].to_numpy(dtype='float64', na_value=np.nan))
+
+
+
+def test_station_box_plot_data_matches_masks(unified_data):
+
+    data = unified_data[unified_data['year'] == 2015]
+    box_plot_data, station_labels = station_box_plot_data(data, 'NO2', partition_by_station(data))
+
+    for readings, station in zip(box_plot_data, station_labels):
+        np.testing.assert_array_equal(readings, data.loc[data[STATION_COLUMN] == station, 'NO2'].dropna().to_numpy())
+
+
+def test_station_box_plot_data_same_for_compact_data(unified_data, compact_unified_data):
+
+    data = unified_data[unified_data['year'] == 2015]
+    compact = compact_unified_data[compact_unified_data['year'] == 2015]
+    box_plot_data, station_labels = station_box_plot_data(data, 'PM 2.5')
+    compact_box_plot_data, compact_station_labels = station_box_plot_data(compact, 'PM 2.5')
+
+    assert compact_station_labels == station_labels
+    for compact_readings, readings in zip(compact_box_plot_data, box_plot_data):
+        np.testing.assert_array_equal(compact_readings, readings)
@@ -0,0 +1,38 @@
+import json
+
+from AirQualityData import STATION_COLUMN, DATA_DIR, list_year_files, load_years
+from BenchmarkPipeline import main, make_synthetic_corpus
+
+
+
+def test_synthetic_replicas_have_other_dates_and_stations(tmp_path):
+
+    # Replicas of a year take the dates of earlier years, so the distinct dates of a single file are counted
+    year, file_path = list_year_files(DATA_DIR)[-1]
+    data_dir = tmp_path / 'csv'
+    data_dir.mkdir()
+    (data_dir / file_path.name).write_bytes(file_path.read_bytes())
+
+    data = load_years(list_year_files(data_dir))
+    synthetic = load_years(list_year_files(make_synthetic_corpus(data_dir, tmp_path / 'csv_3x', 3)))
+
+    assert len(synthetic) == 3*len(data)
+    assert synthetic['Sampling Date'].nunique() == 3*data['Sampling Date'].nunique()
+    assert synthetic[STATION_COLUMN].nunique() == 3*data[STATION_COLUMN].nunique()
+    # Shifted dates are still understood, in their own convention
+    assert synthetic['date'].notna().sum() == 3*data['date'].notna().sum()
+    assert synthetic['granularity'].value_counts().to_dict() == (3*data['granularity'].value_counts()).to_dict()
+
+
+def test_main_saves_results_of_every_stage(tmp_path):
+
+    output = tmp_path / 'results.json'
+    assert main(['--scales', '1', '--repeat', '1', '--max-workers', '2', '--output', str(output)]) == 0
+
+    with open(output) as output_file:
+        report = json.load(output_file)
+    assert report['meta']['repeat'] == 1 and report['meta']['max_workers'] == 2
+    assert {result['stage'].split('/')[0] for result in report['results']} == {'ingestion', 'transformation', 'rendering'}
+    for result in report['results']:
+        assert set(result) == {'corpus', 'stage', 'rows', 'seconds', 'peak_bytes', 'traced_peak_bytes'}
+        assert result['corpus'] == '1x' and result['seconds'] >= 0 and result['peak_bytes'] >= 0
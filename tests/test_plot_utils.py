@@ -0,0 +1,150 @@
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from PlotUtils import lttb_indices, _as_numeric, create_line_plot, create_scatter_plot, render_batch
+
+
+
+'''
+    Straightforward Largest-Triangle-Three-Buckets, following the original description (Steinarsson, 2013).
+'''
+def reference_lttb(x, y, n_out):
+
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+
+        range_start = int(np.floor(i * every)) + 1
+        range_end = int(np.floor((i + 1) * every)) + 1
+        best_area, best = -1.0, range_start
+        for j in range(range_start, range_end):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best_area, best = area, j
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+
+    return np.array(selected)
+
+
+
+@pytest.mark.parametrize('n, n_out', [(10, 3), (100, 10), (1000, 37), (5000, 500), (4, 3)])
+def test_lttb_matches_reference(n, n_out):
+
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(0.1, 2.0, n))
+    y = rng.normal(size=n).cumsum()
+
+    np.testing.assert_array_equal(lttb_indices(x, y, n_out), reference_lttb(list(x), list(y), n_out))
+
+
+def test_lttb_keeps_short_lines_and_rejects_small_budgets():
+
+    np.testing.assert_array_equal(lttb_indices([1, 2, 3], [4, 5, 6], 5), [0, 1, 2])
+    with pytest.raises(ValueError):
+        lttb_indices(np.arange(10), np.arange(10), 2)
+
+
+
+def test_as_numeric_converts_date_objects():
+
+    days = [date(2015, 1, 1), date(2015, 1, 2), None]
+    values, is_date = _as_numeric(days)
+
+    assert is_date
+    np.testing.assert_allclose(values[:2], _as_numeric(np.array(['2015-01-01', '2015-01-02'], dtype='datetime64[ns]'))[0])
+    assert np.isnan(values[2])
+
+    values, is_date = _as_numeric([1, 2, 3])
+    assert not is_date
+
+
+@pytest.mark.parametrize('plot_function', [create_line_plot, create_scatter_plot])
+def test_decimated_plots_accept_date_objects(plot_function, tmp_path):
+
+    for start in [date(2015, 1, 1), datetime(2015, 1, 1)]:
+        xdata = [start + timedelta(days=i) for i in range(20)]
+        plot_function(xdata, list(np.arange(20.0)), {'max_points': 5, 'show_fig': False, 'close_fig': True,
+                                                     'save_fig': str(tmp_path / 'plot.png')})
+        assert (tmp_path / 'plot.png').is_file()
+
+
+def test_line_plot_decimates_categories_on_positions(tmp_path):
+
+    xdata = ['station '+str(i) for i in range(30)]
+    create_line_plot(xdata, list(np.sin(np.arange(30.0))), {'max_points': 6, 'show_fig': False,
+                                                              'save_fig': str(tmp_path / 'plot.png')})
+
+    lines = plt.gca().get_lines()
+    assert len(lines) == 1 and len(lines[0].get_xdata()) == 6
+    plt.close('all')
+
+
+def test_scatter_plot_draws_categories_on_positions(tmp_path):
+
+    xdata = ['station '+str(i % 4) for i in range(30)]
+    create_scatter_plot(xdata, list(np.arange(30.0)), {'max_points': 6, 'show_fig': False, 'close_fig': True,
+                                                       'save_fig': str(tmp_path / 'plot.png')})
+
+    assert (tmp_path / 'plot.png').is_file()
+    assert plt.get_fignums() == []
+
+
+@pytest.mark.parametrize('plot_function', [create_line_plot, create_scatter_plot])
+@pytest.mark.parametrize('n_points', [6, 1000])
+def test_decimated_plots_accept_smallest_max_points(plot_function, n_points, tmp_path):
+
+    plot_function(np.arange(n_points), np.sin(np.arange(n_points)), {'max_points': 3, 'show_fig': False, 'close_fig': True,
+                                                                      'save_fig': str(tmp_path / 'plot.png')})
+
+    assert (tmp_path / 'plot.png').is_file()
+    assert plt.get_fignums() == []
+
+
+@pytest.mark.parametrize('plot_function', [create_line_plot, create_scatter_plot])
+def test_decimated_plots_reject_small_max_points(plot_function):
+
+    with pytest.raises(ValueError):
+        plot_function(np.arange(10), np.arange(10), {'max_points': 2, 'show_fig': False})
+    assert plt.get_fignums() == []
+
+
+
+def test_render_batch_keeps_order_and_writes_every_figure(tmp_path):
+
+    rng = np.random.default_rng(7)
+    plot_specs = []
+    for i, plot_type in enumerate(['line', 'scatter', 'box', 'line', 'scatter', 'box', 'line']):
+        plot_spec = {'plot_type': plot_type, 'ydata': rng.normal(size=50),
+                     'opts': {'title': plot_type+' '+str(i), 'save_fig': str(tmp_path / (str(i)+'_'+plot_type+'.png'))}}
+        if plot_type == 'box':
+            plot_spec['ydata'] = [rng.normal(size=20), rng.normal(size=30)]
+        else:
+            plot_spec['xdata'] = np.arange(50)
+        plot_specs.append(plot_spec)
+
+    saved_figs = render_batch(plot_specs, max_workers=2, batch_size=2)
+
+    assert saved_figs == [plot_spec['opts']['save_fig'] for plot_spec in plot_specs]
+    for save_fig in saved_figs:
+        assert Path(save_fig).stat().st_size > 0
+    assert plt.get_fignums() == []
+
+
+def test_render_batch_rejects_unknown_plot_type(tmp_path):
+
+    with pytest.raises(ValueError):
+        render_batch([{'plot_type': 'pie', 'ydata': [1, 2], 'opts': {'save_fig': str(tmp_path / 'pie.png')}}])
+    with pytest.raises(ValueError):
+        render_batch([], max_workers=0)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from AirQualityData import STATION_COLUMN, UNKNOWN_STATION
+from PollutantAnalytics import (ANALYTICS_POLLUTANTS, ROLLING_WINDOWS, STANDARD_LIMITS, daily_station_means, rolling_means,
+                                exceedance_counts, sub_index, aqi_sub_indices, station_series)
+
+
+
+@pytest.fixture(scope='module')
+def daily(unified_data):
+
+    return daily_station_means(unified_data)
+
+
+
+def test_daily_station_means_one_row_per_station_day(daily, unified_data):
+
+    assert not daily.duplicated([STATION_COLUMN, 'date']).any()
+    assert UNKNOWN_STATION in set(daily[STATION_COLUMN])
+
+    # Means of every (station, day) against a plain groupby of the daily rows
+    rows = unified_data[unified_data['granularity'] == 'daily'].copy()
+    rows[STATION_COLUMN] = rows[STATION_COLUMN].astype(object).fillna(UNKNOWN_STATION)
+    expected = rows.groupby([STATION_COLUMN, 'date'])['NO2'].mean()
+    np.testing.assert_allclose(daily.set_index([STATION_COLUMN, 'date'])['NO2'].to_numpy(), expected.to_numpy())
+
+
+def test_daily_station_means_same_for_compact_data(daily, compact_unified_data):
+
+    pd.testing.assert_frame_equal(daily_station_means(compact_unified_data), daily)
+
+
+
+def test_rolling_means_match_pandas_time_rolling(daily):
+
+    rolled = rolling_means(daily)
+
+    for station, station_rows in daily.groupby(STATION_COLUMN):
+        station_rolled = rolled[rolled[STATION_COLUMN] == station]
+        for pollutant in ANALYTICS_POLLUTANTS:
+            readings = station_rows.set_index('date')[pollutant]
+            for name, days in ROLLING_WINDOWS.items():
+                expected = readings.rolling(str(days)+'D', min_periods=1).mean()
+                np.testing.assert_allclose(station_rolled[pollutant+' '+name].to_numpy(), expected.to_numpy(),
+                                           err_msg=station+' '+pollutant+' '+name)
+
+
+def test_rolling_means_min_periods(daily):
+
+    rolled = rolling_means(daily, windows={'7d': 7}, min_periods=3)
+
+    for station, station_rows in daily.groupby(STATION_COLUMN):
+        expected = station_rows.set_index('date')['NO2'].rolling('7D', min_periods=3).mean()
+        np.testing.assert_allclose(rolled.loc[rolled[STATION_COLUMN] == station, 'NO2 7d'].to_numpy(), expected.to_numpy())
+
+
+def test_rolling_means_rejects_empty_windows(daily):
+
+    with pytest.raises(ValueError):
+        rolling_means(daily, windows={'none': 0})
+
+
+
+def test_exceedance_counts_match_masks(daily):
+
+    counts = exceedance_counts(daily)
+
+    for pollutant, limit in STANDARD_LIMITS.items():
+        expected = (daily[pollutant] > limit).groupby([daily[STATION_COLUMN], daily['year']]).sum()
+        np.testing.assert_array_equal(counts[pollutant].to_numpy(), expected.to_numpy())
+        measured = daily[pollutant].notna().groupby([daily[STATION_COLUMN], daily['year']]).sum()
+        np.testing.assert_array_equal(counts[pollutant+' days'].to_numpy(), measured.to_numpy())
+
+
+
+def test_sub_index_breakpoints():
+
+    # Breakpoints themselves, a point inside a segment, the extended last segment, the cap and missing readings
+    np.testing.assert_allclose(sub_index([0, 30, 45, 60, 250, 300, 1000, np.nan], 'PM 2.5'),
+                               [0, 50, 75, 100, 400, 400 + 50*100/130, 500, np.nan])
+    np.testing.assert_allclose(sub_index([100, 175, 430], 'RSPM/PM10'), [100, 150, 400])
+    np.testing.assert_allclose(sub_index([40, 80, 130], 'NO2'), [50, 100, 150])
+
+    with pytest.raises(ValueError):
+        sub_index([1.0], 'SPM')
+
+
+def test_aqi_is_largest_sub_index(daily):
+
+    indices = aqi_sub_indices(daily)
+    sub_indices = indices[[pollutant+' sub-index' for pollutant in ANALYTICS_POLLUTANTS]]
+
+    np.testing.assert_allclose(indices['AQI'].to_numpy(), sub_indices.max(axis=1).to_numpy())
+    assert indices['AQI'].isna().equals(sub_indices.isna().all(axis=1))
+
+
+
+def test_station_series_slices_one_station(daily):
+
+    station = daily[STATION_COLUMN].iloc[-1]
+    dates, values = station_series(daily, station, 'NO2', start='2015-01-01', end='2015-06-30')
+
+    rows = daily[(daily[STATION_COLUMN] == station) & daily['date'].between('2015-01-01', '2015-06-30')].dropna(subset=['NO2'])
+    np.testing.assert_array_equal(dates.to_numpy(), rows['date'].to_numpy())
+    np.testing.assert_array_equal(values.to_numpy(), rows['NO2'].to_numpy())
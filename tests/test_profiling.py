@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+import pytest
+
+from AirQualityData import list_year_files, load_years
+from PlotUtils import create_line_plot, render_batch
+from Profiling import enable_profiling, disable_profiling, profiled, profile_stage
+from RenderCache import RenderCache
+
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+
+    trace_path = tmp_path / 'trace.json'
+    enable_profiling(trace_path, tmp_path / 'spans.log')
+    yield trace_path
+    disable_profiling()
+
+
+'''
+    Spans recorded so far, as written in the trace file once profiling is disabled.
+'''
+def recorded_spans(trace_path):
+
+    disable_profiling()
+    with open(trace_path) as trace_file:
+        return json.load(trace_file)['traceEvents']
+
+
+
+def test_failing_calls_record_error_spans(trace_path):
+
+    @profiled(category='io')
+    def failing_read():
+        raise OSError("no such file")
+
+    with pytest.raises(OSError):
+        failing_read()
+    with pytest.raises(ValueError):
+        with profile_stage('section', category='section', year=2015):
+            raise ValueError("no data")
+
+    read_span, section_span = recorded_spans(trace_path)
+    assert read_span['name'] == 'failing_read' and 'no such file' in read_span['args']['error']
+    assert section_span['args']['year'] == 2015 and 'no data' in section_span['args']['error']
+
+
+def test_render_cache_hits_are_recorded(trace_path, tmp_path):
+
+    render_cache = RenderCache(tmp_path / 'renders')
+    opts = {'title': 'NO2', 'show_fig': False, 'close_fig': True, 'save_fig': str(tmp_path / 'plot.png'), 'render_cache': render_cache}
+    create_line_plot(np.arange(10), np.arange(10.0), opts)
+    create_line_plot(np.arange(10), np.arange(10.0), opts)
+    render_batch([{'plot_type': 'line', 'xdata': np.arange(10), 'ydata': np.arange(10.0), 'opts': opts}])
+
+    plot_spans = [span for span in recorded_spans(trace_path) if span['name'] == 'create_line_plot']
+    assert [span['args']['cache_hit'] for span in plot_spans] == [False, True, True]
+
+
+def test_trace_has_complete_events(trace_path, tmp_path):
+
+    with profile_stage('section', category='section') as details:
+        create_line_plot([1, 2, 3], [4, 5, 6], {'show_fig': False, 'close_fig': True, 'save_fig': str(tmp_path / 'plot.png')})
+        details['rows'] = 3
+
+    spans = recorded_spans(trace_path)
+    assert {span['name'] for span in spans} == {'section', 'create_line_plot', 'savefig'}
+    for span in spans:
+        assert span['ph'] == 'X' and span['dur'] >= 0 and {'ts', 'pid', 'tid', 'cat', 'args'} <= set(span)
+
+    with open(tmp_path / 'spans.log') as log_file:
+        assert [json.loads(line)['stage'] for line in log_file] == [span['name'] for span in spans]
+
+
+def test_render_batch_records_one_span_per_spec(trace_path, tmp_path):
+
+    render_cache = RenderCache(tmp_path / 'renders')
+    opts = {'title': 'NO2', 'save_fig': str(tmp_path / 'plot.png'), 'render_cache': render_cache}
+    plot_spec = {'plot_type': 'line', 'xdata': np.arange(10), 'ydata': np.arange(10.0), 'opts': opts}
+    render_batch([plot_spec, dict(plot_spec, ydata=np.arange(10.0) + 1), plot_spec])
+
+    spans = recorded_spans(trace_path)
+    plot_spans = [span for span in spans if span['name'] == 'create_line_plot']
+    assert [span['args']['cache_hit'] for span in plot_spans] == [False, False, True]
+    assert [span['args']['rows'] for span in plot_spans] == [10, 10, 10]
+    assert len([span for span in spans if span['name'] == 'savefig']) == 2
+
+
+def test_worker_processes_do_not_record(trace_path, tmp_path):
+
+    load_years(list_year_files()[:4], max_workers=2)
+
+    assert recorded_spans(trace_path) == []
+    with open(tmp_path / 'spans.log') as log_file:
+        assert log_file.read() == ''
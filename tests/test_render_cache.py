@@ -0,0 +1,84 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+import PlotUtils
+from PlotUtils import create_line_plot
+from RenderCache import RenderCache, IGNORED_OPTIONS
+
+
+
+@pytest.fixture
+def render_cache(tmp_path):
+
+    return RenderCache(tmp_path / 'renders')
+
+
+def write_file(file_path, size):
+
+    file_path.write_bytes(b'x'*size)
+
+    return str(file_path)
+
+
+
+def test_key_ignores_options_not_changing_the_image(render_cache):
+
+    xdata, ydata = np.arange(10), np.arange(10.0)
+    opts = {'title': 'NO2', 'save_fig': 'a.png'}
+    key = render_cache.key('line', xdata, ydata, opts)
+
+    ignored_opts = dict(opts, save_fig='other/b.PNG', show_fig=True, reuse_last_fig=None, close_fig=True, render_cache=render_cache)
+    assert set(ignored_opts) - set(opts) <= set(IGNORED_OPTIONS)
+    assert render_cache.key('line', xdata, ydata, ignored_opts) == key
+
+    assert render_cache.key('line', xdata, ydata+1, opts) != key
+    assert render_cache.key('scatter', xdata, ydata, opts) != key
+    assert render_cache.key('line', xdata, ydata, dict(opts, title='SO2')) != key
+    assert render_cache.key('line', xdata, ydata, dict(opts, save_fig='a.svg')) != key
+
+
+def test_hit_copies_figure_without_rendering(render_cache, tmp_path, monkeypatch):
+
+    save_fig = tmp_path / 'plot.png'
+    opts = {'title': 'NO2', 'show_fig': False, 'close_fig': True, 'save_fig': str(save_fig), 'render_cache': render_cache}
+    create_line_plot(np.arange(10), np.arange(10.0), opts)
+    rendered = save_fig.read_bytes()
+    save_fig.unlink()
+
+    def fail_to_render(*args, **kwargs):
+        raise AssertionError("figure should be copied from the render cache")
+    monkeypatch.setattr(PlotUtils.plt, 'subplots', fail_to_render)
+
+    create_line_plot(np.arange(10), np.arange(10.0), opts)
+    assert save_fig.read_bytes() == rendered
+    assert plt.get_fignums() == []
+
+
+def test_eviction_removes_least_recently_used_first(render_cache, tmp_path):
+
+    for i, name in enumerate(['a', 'b', 'c']):
+        render_cache.store(name, write_file(tmp_path / (name+'.png'), 100))
+        os.utime(render_cache._path(name, 'x.png'), (1000+i, 1000+i))
+
+    # Fetching 'a' makes it the most recently used, so 'b' is the oldest and the only one not fitting
+    assert render_cache.fetch('a', str(tmp_path / 'copy.png'))
+    render_cache.max_bytes = 300
+    render_cache.store('d', write_file(tmp_path / 'd.png', 100))
+
+    assert sorted(cached_path.name for cached_path in render_cache.cache_dir.iterdir()) == ['a.png', 'c.png', 'd.png']
+
+
+def test_figure_missing_at_fetch_is_a_miss(render_cache, tmp_path):
+
+    save_fig = tmp_path / 'plot.png'
+    assert not render_cache.fetch('a', str(save_fig))
+
+    render_cache.store('a', write_file(tmp_path / 'a.png', 10))
+    # e.g. evicted by another process between the key lookup and the copy
+    render_cache._path('a', str(save_fig)).unlink()
+
+    assert not render_cache.fetch('a', str(save_fig))
+    assert not save_fig.exists()
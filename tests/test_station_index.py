@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from AirQualityData import STATION_COLUMN
+from StationIndex import build_station_index, sort_for_index, load_station_index
+
+
+
+@pytest.fixture(scope='module', params=['unified', 'compact'])
+def indexed(request, unified_data, compact_unified_data):
+
+    data = unified_data if request.param == 'unified' else compact_unified_data
+
+    return build_station_index(data), sort_for_index(data)
+
+
+
+@pytest.mark.parametrize('start, end, year', [(None, None, None), ('2009-03-01', '2014-02-10', None),
+                                              ('2015-06-01', None, None), (None, None, 2009), (None, None, 1987),
+                                              ('2015-03-01', '2015-03-31', 2015), ('2015-03-01', None, 2014)])
+def test_query_matches_boolean_mask(indexed, start, end, year):
+
+    index, sorted_data = indexed
+
+    for station in index.stations():
+        is_selected = sorted_data[STATION_COLUMN] == station
+        if year is not None:
+            is_selected &= sorted_data['date'].dt.year == year
+        if start is not None:
+            is_selected &= sorted_data['date'] >= pd.Timestamp(start)
+        if end is not None:
+            is_selected &= sorted_data['date'] <= pd.Timestamp(end)
+
+        pd.testing.assert_frame_equal(index.query(station, start, end, year=year), sorted_data[is_selected].reset_index(drop=True))
+
+
+def test_open_ended_queries_leave_undated_rows_out(unified_data):
+
+    data = unified_data.iloc[:3].copy()
+    data[STATION_COLUMN] = 'A'
+    data['date'] = pd.to_datetime(['2015-01-01', None, '2015-02-01'])
+    index = build_station_index(data)
+
+    assert list(index.query('A', start='2015-01-15')['date']) == [pd.Timestamp('2015-02-01')]
+    assert list(index.query('A', end='2015-01-15')['date']) == [pd.Timestamp('2015-01-01')]
+    assert index.query('A')['date'].isna().sum() == 1
+
+
+def test_row_range_of_unknown_station_is_empty(indexed):
+
+    index, sorted_data = indexed
+
+    assert index.row_range('No such station') == (0, 0)
+    assert index.row_range(index.stations()[0], year=1900) == (0, 0)
+
+
+def test_year_offsets_cover_dated_rows(indexed):
+
+    index, sorted_data = indexed
+
+    for (station, year), (first, last) in index.year_offsets.items():
+        rows = sorted_data.iloc[first:last]
+        assert (rows[STATION_COLUMN] == station).all()
+        assert (rows['date'].dt.year == year).all()
+
+    assert sum(last - first for first, last in index.year_offsets.values()) == sorted_data['date'].notna().sum()
+
+
+def test_query_box_plot_data_matches_station_readings(indexed):
+
+    index, sorted_data = indexed
+    box_plot_data, station_labels = index.query_box_plot_data('NO2', year=2015)
+
+    for readings, station in zip(box_plot_data, station_labels):
+        expected = sorted_data.loc[(sorted_data[STATION_COLUMN] == station) & (sorted_data['year'] == 2015), 'NO2'].dropna()
+        np.testing.assert_array_equal(readings, expected.to_numpy())
+
+
+
+def test_stored_index_queries_match_in_memory_index(unified_data, tmp_path):
+
+    pyarrow = pytest.importorskip('pyarrow')
+
+    index = build_station_index(unified_data)
+    load_station_index(cache_dir=tmp_path)
+    # Opened again from the stored table, which is memory mapped and sliced per query
+    stored_index = load_station_index(cache_dir=tmp_path)
+    assert isinstance(stored_index.table, pyarrow.Table)
+    assert len(list(tmp_path.glob('station_index-*'))) == 1
+
+    for station in index.stations():
+        for start, end, year in [(None, None, None), ('2009-03-01', '2014-02-10', None), (None, None, 2015)]:
+            pd.testing.assert_frame_equal(stored_index.query(station, start, end, year=year), index.query(station, start, end, year=year))